@@ -6,202 +6,573 @@
 import numpy as np
 import pandas as pd
 import scipy.cluster.hierarchy as spc
+import scipy.spatial.distance as spd
+import cobra as cb
+import time
+import warnings
+from corpse.matrixIO import asFrame, readSidecar, writeSidecar
+from corpse.workerPool import iterTasks
 
 class FVAjuggler:
+    # number of elements of the intermediate arrays in calcFVAdist()
+    block_elements = 2**24
+
     def __init__(self):
         self.name = "FVAjuggler"
+        self.failed = {}
 
-    def filterFVA(self,min_mat, max_mat, method ="any"):
-        '''filter the FVA results by variance
-        @ min_mat,max_mat = the matrix containing values for the lower (min) and upper (max) bounds of each reaction and sample
+    def filterFVA(self,min_mat, max_mat, method ="any", tol = 1E-6, block_size = None):
+        '''filter the FVA results by variance - returns the rows of min_mat and max_mat which vary between the samples (see filterMask()), values with an absolute value below tol are set to 0. The input is not changed, only the selected rows are copied.
+        @ min_mat,max_mat = the matrix containing values for the lower (min) and upper (max) bounds of each reaction and sample - pandas.DataFrames, numpy.arrays or matrixIO.matrixFiles (or their paths, ".npy" files are used as memory maps)
         @ method = one of "any" or "all", defines if both (all) variances for lower and upper bound or just one (any) must be above 0 do stay in the data set.
+        @ tol, block_size - see filterMask()
         '''
-        
-
-        # remove numerical stuff
-        min_mat[np.absolute(min_mat) < 1E-6] = 0
-        max_mat[np.absolute(max_mat) < 1E-6] = 0
+        min_mat, max_mat = asFrame(min_mat), asFrame(max_mat)
+        sel = self.filterMask(min_mat, max_mat, method = method, tol = tol, block_size = block_size)
+        filtered = []
+        for mat in [min_mat, max_mat]:
+            # remove numerical stuff
+            values = np.asarray(mat)[sel]
+            values[np.absolute(values) < tol] = 0
+            if isinstance(mat, pd.DataFrame):
+                values = pd.DataFrame(values, index = mat.index[sel], columns = mat.columns)
+            filtered.append(values)
+        return(filtered[0], filtered[1])
 
-        min_var = np.var(min_mat, 1)
-        max_var = np.var(max_mat, 1)
-
-        
-        t_max = 0 #np.quantile(max_var,thrsld)
-        t_min = 0 #np.quantile(min_var,thrsld)
-        print(t_max)
-        print(t_min)
+    def filterMask(self, min_mat, max_mat, method = "any", tol = 1E-6, indices = False, block_size = None):
+        '''returns a boolean array which is True for the reactions which vary between the samples, or the row indices of these reactions if indices is True - the input is not changed or copied
+        @ min_mat,max_mat = the matrix containing values for the lower (min) and upper (max) bounds of each reaction and sample - pandas.DataFrames, numpy.arrays or matrixIO.matrixFiles (or their paths, ".npy" files are used as memory maps)
+        @ method = one of "any" or "all", defines if both (all) variances for lower and upper bound or just one (any) must be above 0 do stay in the data set.
+        @ tol = values with an absolute value below tol are treated as 0
+        @ block_size = number of samples read at once, see rowVariance()
+        '''
+        if method not in ["any", "all"]:
+            raise ValueError("Method must be 'all' or 'any'")
+        min_mat, max_mat = asFrame(min_mat), asFrame(max_mat)
+        min_var = self.rowVariance(min_mat, tol = tol, block_size = block_size)
+        max_var = self.rowVariance(max_mat, tol = tol, block_size = block_size)
         if method == "any":
-            sel = np.any(pd.DataFrame({"min":min_var > t_min, "max":max_var>t_max}),1)
-        elif method == "all":
-            sel = np.all(pd.DataFrame({"min":min_var > t_min, "max":max_var>t_max}),1)
+            sel = (min_var > 0) | (max_var > 0)
         else:
-            raise ValueError("Method must be 'all' or 'any'")
+            sel = (min_var > 0) & (max_var > 0)
+        if indices:
+            return(np.flatnonzero(sel))
+        return(sel)
 
-        min_mat = min_mat.loc[sel,:]
-        max_mat = max_mat.loc[sel,:]
-        return(min_mat, max_mat)
+    def rowVariance(self, mat, tol = 1E-6, block_size = None):
+        '''returns the variance of each row of the matrix in a single pass over the data - the samples (columns) are read in blocks of block_size and the mean and variance of the blocks are merged (Welford/Chan), thus the matrix can be a memory map as well. Values with an absolute value below tol are treated as 0, rows with the same value in all samples have a variance of exactly 0.
+        @ mat = numpy.array, numpy.memmap, pandas.DataFrame or matrixIO.matrixFile with reactions in rows and samples in columns
+        @ block_size = number of samples read at once, by default chosen so that a block has about self.block_elements elements
+        '''
+        mat = asFrame(mat)
+        mat = mat.values if isinstance(mat, pd.DataFrame) else mat
+        n_rows, n_cols = mat.shape
+        if block_size is None:
+            block_size = max(1, self.block_elements // max(1, n_rows))
+        count = 0
+        mean = np.zeros(n_rows)
+        m2 = np.zeros(n_rows)
+        low = np.full(n_rows, np.inf)
+        high = np.full(n_rows, -np.inf)
+        for start in range(0, n_cols, block_size):
+            stop = min(start + block_size, n_cols)
+            block = np.asarray(mat[:,start:stop], dtype = float)
+            block = np.where(np.absolute(block) < tol, 0, block)
+            n_block = stop - start
+            mean_block = np.mean(block, axis = 1)
+            m2_block = np.sum((block - mean_block[:,None])**2, axis = 1)
+            delta = mean_block - mean
+            total = count + n_block
+            mean = mean + delta*n_block/total
+            m2 = m2 + m2_block + delta**2*count*n_block/total
+            count = total
+            low = np.minimum(low, np.min(block, axis = 1))
+            high = np.maximum(high, np.max(block, axis = 1))
+        if count == 0:
+            return(np.full(n_rows, np.nan))
+        var = m2/count
+        var[low == high] = 0
+        return(var)
 
-    def clusterFVA(self, min_mat, max_mat, thrld = 0.75):
+    def clusterFVA(self, min_mat, max_mat, thrld = 0.75, method = "complete", dtype = None, block_size = None):
         '''clusters the data by correlation and returns the most representative data point for each cluster
-        @ min_mat,max_mat = the matrix containing values for the lower (min) and upper (max) bounds of each reaction and sample
+        @ min_mat,max_mat = the matrix containing values for the lower (min) and upper (max) bounds of each reaction and sample - pandas.DataFrames or matrixIO.matrixFiles (or their paths)
         @thrld - defines the minimum correlation within one cluster, should range between 0 and 1
+        @method - "complete" uses the complete linkage of all reactions (scipy.cluster.hierarchy), "leader" assigns all reactions with a correlation of at least thrld to the first reaction of each cluster (leader clustering) - this needs only one row of the correlation matrix for each cluster and is much faster for many reactions
+        @dtype - the precision of the correlations, by default "float64" for "complete" and "float32" for "leader"
+        @block_size - number of rows of the correlation matrix calculated at once, by default chosen so that a block has about self.block_elements elements
         '''
 
         
         if thrld < 0 or thrld > 1:
             raise ValueError("thrld must range between 0 and 1")
+        if method not in ["complete", "leader"]:
+            raise ValueError("method must be one of: 'complete', 'leader'")
+        if dtype is None:
+            dtype = "float64" if method == "complete" else "float32"
 
-        thrld = 1-thrld
-        
         # filter the matrices for non variance
-        a,b = filterFVA(min_mat,max_mat)
+        a,b = self.filterFVA(min_mat,max_mat)
+        min_max = np.concatenate([np.asarray(a, dtype = float), np.asarray(b, dtype = float)], axis = 1)
+        names = list(a.index)
+        if block_size is None:
+            block_size = max(1, self.block_elements // max(1, min_max.shape[0]))
 
-        # calc correlation matrix
-        min_max = pd.concat([a,b],1)
-        corMat = min_max.transpose().corr()
-        corMatAb = np.absolute(corMat)
+        # standardized rows - the correlation matrix is z z^T
+        z = self.standardize(min_max, dtype)
 
-        # get linkage information
-        linkage = spc.linkage(min_max, method = "complete", metric="correlation")
-        idx = spc.fcluster(linkage, 0.25, "distance")
-        
-        # get the center of each cluster by means of the most 
-        centers = list()
-        for i in range(min(idx), max(idx)+1):
-            sel = idx==i
-            mat = corMatAb.loc[sel,sel]
-            sums = np.sum(mat,1)
-            n_i = np.where(sums == np.amax(sums))
-            name = mat.index[n_i[0][0]]
-            centers.append(name)
+        # get the cluster of each reaction
+        if method == "complete":
+            linkage = spc.linkage(min_max, method = "complete", metric="correlation")
+            idx = spc.fcluster(linkage, 1-thrld, "distance")
+        else:
+            idx = self.leaderCluster(z, thrld, block_size)
+
+        # get the center of each cluster by means of the highest sum of absolute correlations within the cluster
+        centers = [names[i] for i in self.clusterCenters(z, idx, block_size)]
         
         # return the matrices for the cluster centers and the cluster association
-        cluster = {corMatAb.index[i]:x for i,x in enumerate(idx)}
-        return(min_mat.loc[centers,:], max_mat.loc[centers,:], cluster)
+        cluster = {names[i]:x for i,x in enumerate(idx)}
+        return(a.loc[centers,:], b.loc[centers,:], cluster)
 
+    def standardize(self, array, dtype = "float64"):
+        ''' returns the rows of the array centered and scaled, so that the correlation matrix of the rows is the product with its own transpose - rows without variance are 0'''
+        z = np.asarray(array, dtype = float)
+        z = z - np.mean(z, axis = 1, keepdims = True)
+        norm = np.sqrt(np.sum(z*z, axis = 1, keepdims = True))
+        norm[norm == 0] = 1
+        return((z/norm).astype(dtype))
 
+    def leaderCluster(self, z, thrld, block_size):
+        ''' assigns each row of the standardized array z (see standardize()) to a cluster - the first row without cluster becomes the leader of a new cluster which gets all rows without cluster that have a correlation of at least thrld to the leader. Returns the cluster number (starting with 1) of each row.'''
+        n = z.shape[0]
+        idx = np.zeros(n, dtype = int)
+        cluster = 0
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            candidates = np.flatnonzero(idx[start:stop] == 0) + start
+            if candidates.size == 0:
+                continue
+            # correlations of all potential leaders in the block to all rows
+            cor = z[candidates,:] @ z.transpose()
+            for k,row in zip(candidates, cor):
+                if idx[k] == 0:
+                    cluster = cluster + 1
+                    idx[(idx == 0) & (row >= thrld)] = cluster
+                    idx[k] = cluster
+        return(idx)
 
-    def calcSampleTaub(self, min1, min2, max1, max2):
-        # get the distance for each reaction in two FVAs
+    def clusterCenters(self, z, idx, block_size):
+        ''' returns the row of the center of each cluster (ordered by cluster number) - the center is the row with the highest sum of absolute correlations to all rows of the same cluster, the first one if there are several
+        @ z - the standardized array, see standardize()
+        @ idx - the cluster number of each row'''
+        n = z.shape[0]
+        order = np.argsort(idx, kind = "stable")
+        clusters, starts = np.unique(idx[order], return_index = True)
+        position = np.searchsorted(clusters, idx)
+        column = np.argsort(order)
+        sums = np.zeros(n)
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            cor = np.absolute(z[start:stop,:] @ z[order,:].transpose())
+            # the correlation of each row to itself is 1
+            cor[np.arange(stop-start), column[start:stop]] = 1
+            sums[start:stop] = np.add.reduceat(cor, starts, axis = 1)[np.arange(stop-start), position[start:stop]]
+        # the blocks of the matrix product round differently, thus equal sums may differ in the last bits
+        sums = np.round(sums, 9)
+        # highest sum first, the first row for ties
+        best = np.lexsort((np.arange(n), -sums, idx))
+        return(best[np.searchsorted(idx[best], clusters)])
 
-        idx = range(np.size(min1))
-        d = np.max(pd.DataFrame({"x1" : min1-max1,
-            "x2" : min1 - max2,
-            "x3" : min2 - max1,
-            "x4" : min2 - max2},
-            index = idx), 1)
-        m = np.mean(pd.DataFrame({"x1" : max1-min1,
-            "x2" : max2 - min2},
-            index = idx),1)
-
-        nonzero = list(m != 0)
-        d.loc[nonzero] = d.loc[nonzero]/m.loc[nonzero]
-        d.loc[[not x for x in nonzero]] = -1
-        d = d+2
-        d = np.log2(d)
+    def pairDist(self, min1, min2, max1, max2, dist_method = "Moors"):
+        ''' calculates the distance of the FVA ranges for each reaction - the arrays only need to broadcast against each other, e.g. (samples,1,rxns) and (1,samples,rxns) give the distances of all sample pairs at once
+        @ min1,max1,min2,max2 - arrays with the lower (min) and upper (max) bounds of the first and second sample(s)
+        @ dist_method is either "Moors" or "Taub" or "Jacc"
+        '''
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            if dist_method == "Moors":
+                # Karlis idea to implement the distances
+                d = np.absolute(min1-min2) + np.absolute(max1-max2)
+                m = (max1-min1) + (max2-min2)
+                d = np.where(m != 0, d/m, d)
+            elif dist_method == "Taub":
+                d = np.maximum(np.maximum(min1-max1, min1-max2), np.maximum(min2-max1, min2-max2))
+                m = ((max1-min1) + (max2-min2))/2
+                d = np.log2(np.where(m != 0, d/m, -1) + 2)
+            elif dist_method == "Jacc":
+                # jaccard distance
+                d = np.maximum(np.maximum(min1-max1, min1-max2), np.maximum(min2-max1, min2-max2))
+                d = np.where(d > 0, 0, -d)
+                m = (max1-min1) + (max2-min2)
+                d = np.where(m != 0, d/m, d)
+            else:
+                raise ValueError("method must be one of: 'Moors', 'Taub', 'Jacc'")
         return(d)
 
+    def calcSampleTaub(self, min1, min2, max1, max2):
+        # get the distance for each reaction in two FVAs
+        return(pd.Series(self.pairDist(np.asarray(min1, dtype = float), np.asarray(min2, dtype = float), np.asarray(max1, dtype = float), np.asarray(max2, dtype = float), "Taub")))
+
     def calcSampleMoors(self, min1, min2, max1, max2):
         # Karlis idea to implement the distances
-        
-        idx = range(np.size(min1))
-        d =np.sum( pd.DataFrame({"min" : np.absolute(min1-min2),
-            "max": np.absolute(max1-max2)},
-            index = idx), 1)
-        m = np.sum(pd.DataFrame({"x1" : max1-min1,
-            "x2" : max2 - min2},
-            index = idx),1)
-        nonzero = list(m != 0)
-        d.loc[nonzero] = d.loc[nonzero]/m.loc[nonzero]
-        return(d)
+        return(pd.Series(self.pairDist(np.asarray(min1, dtype = float), np.asarray(min2, dtype = float), np.asarray(max1, dtype = float), np.asarray(max2, dtype = float), "Moors")))
 
     def calcSampleJacc(self, min1, min2, max1, max2):
         # calculate jaccard distance
+        return(pd.Series(self.pairDist(np.asarray(min1, dtype = float), np.asarray(min2, dtype = float), np.asarray(max1, dtype = float), np.asarray(max2, dtype = float), "Jacc")))
 
-        idx = range(np.size(min1))
-        d = np.max(pd.DataFrame({"x1" : min1-max1,
-            "x2" : min1 - max2,
-            "x3" : min2 - max1,
-            "x4" : min2 - max2},
-            index = idx), 1)
-        d[d>0] = -0
-        d = d*-1
-        m = np.sum(pd.DataFrame({"x1" : max1-min1,
-            "x2" : max2 - min2},
-            index = idx),1)
-        nonzero = list(m != 0)
-        d.loc[nonzero] = d.loc[nonzero]/m.loc[nonzero]
-        return(d)
-        
-            
+    def calcFVAdist(self, min_mat, max_mat, dist_method = "Moors", block_size = None):
+        ''' calculates the distances of all sample pairs for all reactions at once and returns an array of shape (samples, samples, reactions), the diagonal is 0
+        @ min_mat,max_mat = the matrix containing values for the lower (min) and upper (max) bounds of each reaction and sample - pandas.DataFrames, numpy.arrays or matrixIO.matrixFiles (or their paths, ".npy" files are used as memory maps)
+        @ dist_method is either "Moors" or "Taub" or "Jacc"
+        @ block_size - number of reactions calculated at once, by default chosen so that the intermediate arrays have about self.block_elements elements - use smaller blocks if memory is tight
+        '''
+        if dist_method not in ["Moors", "Taub", "Jacc"]:
+            raise ValueError("method must be one of: 'Moors', 'Taub', 'Jacc'")
+        min_mat, max_mat = asFrame(min_mat), asFrame(max_mat)
+        min_ar = np.asarray(min_mat, dtype = float)
+        max_ar = np.asarray(max_mat, dtype = float)
+        rxns, samples = min_ar.shape
+        if block_size is None:
+            block_size = max(1, self.block_elements // max(1, samples**2))
+
+        d3 = np.zeros((samples,samples,rxns))
+        for start in range(0, rxns, block_size):
+            stop = min(start + block_size, rxns)
+            mins = min_ar[start:stop,:].T
+            maxs = max_ar[start:stop,:].T
+            d3[:,:,start:stop] = self.pairDist(mins[:,None,:], mins[None,:,:], maxs[:,None,:], maxs[None,:,:], dist_method)
+        d3[np.arange(samples), np.arange(samples), :] = 0
+        return(d3)
+
+    def calcFVAdistCondensed(self, min_mat, max_mat, dist_method = "Moors", path = None, dtype = "float64", block_size = None):
+        ''' calculates the distances of all sample pairs for all reactions, but stores only the upper triangle of each samples x samples matrix (see condensedDist) - returns a condensedDist
+        @ min_mat,max_mat = the matrix containing values for the lower (min) and upper (max) bounds of each reaction and sample - pandas.DataFrames, numpy.arrays or matrixIO.matrixFiles (or their paths, ".npy" files are used as memory maps)
+        @ dist_method is either "Moors" or "Taub" or "Jacc"
+        @ path - ".npy" file to store the distances as memory map, if None the distances are kept in memory
+        @ dtype - "float64" or "float32"
+        @ block_size - number of reactions calculated at once, by default chosen so that the intermediate arrays have about self.block_elements elements
+        '''
+        if dist_method not in ["Moors", "Taub", "Jacc"]:
+            raise ValueError("method must be one of: 'Moors', 'Taub', 'Jacc'")
+        min_mat, max_mat = asFrame(min_mat), asFrame(max_mat)
+        rxns = list(min_mat.index) if isinstance(min_mat, pd.DataFrame) else None
+        samples = list(min_mat.columns) if isinstance(min_mat, pd.DataFrame) else None
+        min_ar = np.asarray(min_mat, dtype = float)
+        max_ar = np.asarray(max_mat, dtype = float)
+        dist = condensedDist(range(min_ar.shape[0]) if rxns is None else rxns,
+                range(min_ar.shape[1]) if samples is None else samples,
+                path = path,
+                dtype = dtype)
+        if block_size is None:
+            block_size = max(1, self.block_elements // max(1, dist.n_pairs))
 
-    def calcFVAdistPerSamplePair(self, min_mat, max_mat, dist_method = "Moors", filt_method = "any", cluster = True):
-        ''' calculate a distance matrix for all sample pairs and reaction, but do the calculation for each sample across all reactions first - this is should be much faster computationally 
+        # the pairs in the order of scipy.spatial.distance.pdist
+        i,j = np.triu_indices(min_ar.shape[1], 1)
+        for start in range(0, min_ar.shape[0], block_size):
+            stop = min(start + block_size, min_ar.shape[0])
+            mins = min_ar[start:stop,:]
+            maxs = max_ar[start:stop,:]
+            dist.array[start:stop,:] = self.pairDist(mins[:,i], mins[:,j], maxs[:,i], maxs[:,j], dist_method)
+        dist.flush()
+        return(dist)
+
+    def reduceFVAdist(self, min_mat, max_mat, dist_method = "Moors", reducer = "mean", axis = "rxns", q = 0.5, square = True, block_size = None):
+        ''' calculates aggregates of the distances without creating the (samples x samples x reactions) array - the distances are calculated in blocks and only the aggregate is kept
+        @ min_mat,max_mat = the matrix containing values for the lower (min) and upper (max) bounds of each reaction and sample - pandas.DataFrames, numpy.arrays or matrixIO.matrixFiles (or their paths, ".npy" files are used as memory maps)
+        @ dist_method is either "Moors" or "Taub" or "Jacc"
+        @ reducer - one of "mean", "sum", "max" or "quantile"
+        @ axis - "rxns" aggregates over the reactions and returns the distances between the samples, "pairs" aggregates over all pairs of different samples and returns a pandas.Series with one value per reaction (e.g. to rank the reactions by variability)
+        @ q - the quantile for reducer = "quantile"
+        @ square - for axis = "rxns" - if True a samples x samples pandas.DataFrame is returned, otherwise the condensed vector of scipy.spatial.distance.pdist, which can be used directly with scipy.cluster.hierarchy.linkage()
+        @ block_size - number of reactions (or sample pairs for axis = "rxns" and reducer = "quantile") calculated at once, by default chosen so that the intermediate arrays have about self.block_elements elements
+        '''
+        if dist_method not in ["Moors", "Taub", "Jacc"]:
+            raise ValueError("method must be one of: 'Moors', 'Taub', 'Jacc'")
+        if reducer not in ["mean", "sum", "max", "quantile"]:
+            raise ValueError("reducer must be one of: 'mean', 'sum', 'max', 'quantile'")
+        if axis not in ["rxns", "pairs"]:
+            raise ValueError("axis must be one of: 'rxns', 'pairs'")
+        min_mat, max_mat = asFrame(min_mat), asFrame(max_mat)
+        rxns = list(min_mat.index) if isinstance(min_mat, pd.DataFrame) else None
+        samples = list(min_mat.columns) if isinstance(min_mat, pd.DataFrame) else None
+        min_ar = np.asarray(min_mat, dtype = float)
+        max_ar = np.asarray(max_mat, dtype = float)
+        n_rxns, n_samples = min_ar.shape
+        # the pairs in the order of scipy.spatial.distance.pdist
+        i,j = np.triu_indices(n_samples, 1)
+
+        if axis == "rxns" and reducer == "quantile":
+            # the quantile needs all reactions of a pair - use blocks of pairs instead of reactions
+            if block_size is None:
+                block_size = max(1, self.block_elements // max(1, n_rxns))
+            result = np.zeros(len(i))
+            for start in range(0, len(i), block_size):
+                stop = min(start + block_size, len(i))
+                i_b, j_b = i[start:stop], j[start:stop]
+                d = self.pairDist(min_ar[:,i_b], min_ar[:,j_b], max_ar[:,i_b], max_ar[:,j_b], dist_method)
+                result[start:stop] = np.quantile(d, q, axis = 0)
+        else:
+            if block_size is None:
+                block_size = max(1, self.block_elements // max(1, len(i)))
+            blocks = []
+            result = None
+            for start in range(0, n_rxns, block_size):
+                stop = min(start + block_size, n_rxns)
+                mins = min_ar[start:stop,:]
+                maxs = max_ar[start:stop,:]
+                d = self.pairDist(mins[:,i], mins[:,j], maxs[:,i], maxs[:,j], dist_method)
+                if axis == "pairs":
+                    if reducer == "quantile":
+                        blocks.append(np.quantile(d, q, axis = 1))
+                    elif reducer == "max":
+                        blocks.append(np.max(d, axis = 1))
+                    elif reducer == "sum":
+                        blocks.append(np.sum(d, axis = 1))
+                    else:
+                        blocks.append(np.mean(d, axis = 1))
+                elif reducer == "max":
+                    result = np.max(d, axis = 0) if result is None else np.maximum(result, np.max(d, axis = 0))
+                else:
+                    result = np.sum(d, axis = 0) if result is None else result + np.sum(d, axis = 0)
+            if axis == "pairs":
+                result = np.concatenate(blocks) if len(blocks) > 0 else np.zeros(0)
+                return(pd.Series(result, index = range(n_rxns) if rxns is None else rxns))
+            if result is None:
+                result = np.zeros(len(i))
+            elif reducer == "mean":
+                result = result/n_rxns
+
+        if square:
+            names = range(n_samples) if samples is None else samples
+            return(pd.DataFrame(spd.squareform(result, checks = False), index = names, columns = names))
+        return(result)
+
+    def loadDist(self, path):
+        ''' opens the distances which were stored with calcFVAdistCondensed(path = path) as condensedDist'''
+        names = readSidecar(path)
+        if len(names) == 0:
+            raise FileNotFoundError("No sidecar file {path}.json with the reaction and sample names".format(path = path))
+        return(condensedDist(names["index"], names["columns"], path = path, array = np.load(path, mmap_mode = "r")))
+
+    def calcFVAdistPerSamplePair(self, min_mat, max_mat, dist_method = "Moors", filt_method = "any", cluster = True, block_size = None, condensed = False, path = None, dtype = "float64"):
+        ''' calculate a distance matrix for all sample pairs and reaction - all pairs are calculated at once, see calcFVAdist()
         @dist_method is either "Moors" or "Taub" or "Jacc"
         @filt_method is either "any" or "all"
+        @block_size - number of reactions calculated at once, see calcFVAdist()
+        @condensed - if True, only the upper triangle is stored and a condensedDist is returned instead of the array, path and dtype are passed to calcFVAdistCondensed()
         '''
         # pre filter or cluster the data
         if cluster:
-            min_mat,max_mat,cluster = clusterFVA(min_mat, max_mat)
+            min_mat,max_mat,cluster = self.clusterFVA(min_mat, max_mat)
         else:
-            min_mat,max_mat = filterFVA(min_mat,max_mat, method = filt_method)
+            min_mat,max_mat = self.filterFVA(min_mat,max_mat, method = filt_method)
 
-        samples = min_mat.shape[1]
-        rxns = min_mat.shape[0]
-        d3 = np.zeros((samples,samples,rxns))
+        if condensed:
+            d3 = self.calcFVAdistCondensed(min_mat, max_mat, dist_method = dist_method, path = path, dtype = dtype, block_size = block_size)
+        else:
+            d3 = self.calcFVAdist(min_mat, max_mat, dist_method = dist_method, block_size = block_size)
         print(d3.shape)
-        
-        for i in range(samples-1):
-            for j in range(i+1,samples):
-                min1 = np.array(min_mat)[:,i]
-                max1 = np.array(max_mat)[:,i]
-                min2 = np.array(min_mat)[:,j]
-                max2 = np.array(max_mat)[:,j]
-                if dist_method == "Moors":
-                    d = calcSampleMoors(min1,min2,max1,max2)
-                elif dist_method == "Taub":
-                    d = calcSampleTaub(min1,min2,max1,max2)
-                elif dist_method == "Jacc":
-                    d = calcSampleJacc(min1,min2,max1,max2)
-                else:
-                    raise ValueError("method must be one of: 'Moors', 'Taub', 'Jacc'")               
-                d3[i,j,:] = d3[j,i,:] = d
         return(d3, cluster)
 
-    def calcFVAdistPerRxn(self, min_mat, max_mat, dist_method = "Moors", filt_method = "any", cluster = True):
-        ''' calculate a distance matrix for all sample pairs and reaction, but do the calculation for each reaction across all sample pairs first - this is should be slower in computation, but has the advantage to filter results already early
+    def calcFVAdistPerRxn(self, min_mat, max_mat, dist_method = "Moors", filt_method = "any", cluster = True, block_size = None, condensed = False, path = None, dtype = "float64"):
+        ''' calculate a distance matrix for all sample pairs and reaction - kept for compatibility, gives the same result as calcFVAdistPerSamplePair()
         @dist_method is either "Moors" or "Taub" or "Jacc"
         @filt_method is either "any" or "all"
+        @block_size, condensed, path, dtype - see calcFVAdistPerSamplePair()
         '''
+        return(self.calcFVAdistPerSamplePair(min_mat, max_mat, dist_method = dist_method, filt_method = filt_method, cluster = cluster, block_size = block_size, condensed = condensed, path = path, dtype = dtype))
 
-        # pre filter or cluster the data
-        if cluster:
-            min_mat,max_mat,cluster = clusterFVA(min_mat, max_mat)
-        else:
-            min_mat,max_mat = filterFVA(min_mat,max_mat, method = filt_method)
+    def sampleFVA(self, model, reactions, sample, fraction_of_optimum = 1.0):
+        ''' runs the FVA for a single sample on the model - the bounds of the sample are only changed temporarily, so the same model (and solver problem) can be used for all samples. Returns the arrays of the minimum and maximum fluxes in the order of reactions.
+        @ model - the cobra.Model
+        @ reactions - list of the IDs of the reactions to run the FVA for
+        @ sample - either a list of reaction IDs (e.g. the reactions of a context specific model, all other reactions are blocked and get a minimum and maximum of 0) or a dictionary of reaction ID:(lower bound, upper bound)
+        @ fraction_of_optimum - see cobra.flux_analysis.flux_variability_analysis()
+        '''
+        mins = np.zeros(len(reactions))
+        maxs = np.zeros(len(reactions))
+        with model:
+            if isinstance(sample, dict):
+                for rxn, bounds in sample.items():
+                    model.reactions.get_by_id(rxn).bounds = bounds
+                active = list(reactions)
+            else:
+                keep = set(sample)
+                for rxn in model.reactions:
+                    if rxn.id not in keep:
+                        rxn.bounds = (0,0)
+                # the blocked reactions need no linear problem
+                active = [x for x in reactions if x in keep]
+            if len(active) > 0:
+                fva = cb.flux_analysis.flux_variability_analysis(model,
+                        reaction_list = active,
+                        fraction_of_optimum = fraction_of_optimum,
+                        processes = 1)
+                pos = {x:i for i,x in enumerate(reactions)}
+                idx = [pos[x] for x in fva.index]
+                mins[idx] = fva["minimum"].values
+                maxs[idx] = fva["maximum"].values
+        return(mins, maxs)
 
-        samples = min_mat.shape[1]
-        rxns = min_mat.shape[0]
-        d3 = np.zeros((samples,samples,rxns))
-        print(d3.shape)
-        
-        for h in range(rxns):
-            for i in range(samples-1):
-                for j in range(i+1,samples):
-                    min1 = np.array(min_mat.iloc[h,i])
-                    max1 = np.array(max_mat.iloc[h,i])
-                    min2 = np.array(min_mat.iloc[h,j])
-                    max2 = np.array(max_mat.iloc[h,j])
-                    if dist_method == "Moors":
-                        d = calcSampleMoors(min1,min2,max1,max2)
-                    elif dist_method == "Taub":
-                        d = calcSampleTaub(min1,min2,max1,max2)
-                    elif dist_method == "Jacc":
-                        d = calcSampleJacc(min1,min2,max1,max2)
-                    else:
-                        raise ValueError("method must be one of: 'Moors', 'Taub', 'Jacc'")               
-                    d3[i,j,:] = d3[j,i,h] = d
-        return(d3, cluster)
+    @staticmethod
+    def initFVAworker(model, reactions, fraction_of_optimum):
+        ''' Creates the state of a worker process of iterCohortFVA() - the model is sent only once to each worker and used for all samples the worker gets'''
+        return((model, reactions, fraction_of_optimum))
+
+    @staticmethod
+    def runFVAworker(state, sample):
+        ''' Runs the FVA for a single sample with the model of a worker process of iterCohortFVA() and returns the minimum and maximum fluxes'''
+        model, reactions, fraction_of_optimum = state
+        return(FVAjuggler().sampleFVA(model, reactions, sample, fraction_of_optimum = fraction_of_optimum))
+
+    def iterCohortFVA(self, model, samples, reactions = None, fraction_of_optimum = 1.0, num_cores = 1):
+        ''' Runs the FVA for all samples on one base model and yields the results as soon as they are finished as tuples of (name, minimum fluxes, maximum fluxes, runtime in s, error). If the FVA fails for a sample, the fluxes are None and error contains the description of the exception.
+        @ model - the cobra.Model, e.g. the consistent model of a batchFastcore
+        @ samples - dictionary of name:sample or list of samples, see sampleFVA() - e.g. {name : batch.get_reactions(name) for name in batch.results}
+        @ reactions - list of the reaction IDs to run the FVA for, all reactions of the model by default
+        @ fraction_of_optimum - see cobra.flux_analysis.flux_variability_analysis()
+        @ num_cores - number of worker processes - each worker gets the model only once and keeps its linear problem for all samples. If num_cores = 1, everything is run in the current process.
+        '''
+        if type(samples) != dict:
+            samples = {i : x for i,x in enumerate(samples)}
+        if reactions is None:
+            reactions = [x.id for x in model.reactions]
+        reactions = list(reactions)
+
+        results = iterTasks(FVAjuggler.runFVAworker, samples,
+                setup = FVAjuggler.initFVAworker,
+                args = (model, reactions, fraction_of_optimum),
+                num_cores = num_cores,
+                state = (model.copy(), reactions, fraction_of_optimum) if num_cores <= 1 else None)
+        for name, fluxes, runtime, error in results:
+            mins, maxs = (None, None) if fluxes is None else fluxes
+            yield((name, mins, maxs, runtime, error))
+
+    def cohortFVA(self, model, samples, reactions = None, fraction_of_optimum = 1.0, num_cores = 1, path = None, dtype = "float64"):
+        ''' Runs the FVA for all samples on one base model (see iterCohortFVA()) and returns the min_mat and max_mat (reactions x samples) for the other functions of the FVAjuggler. The results of each sample are written into the matrices as soon as they are finished. Samples for which the FVA failed get NaN values and are stored with the error in self.failed.
+        @ path - if given, the matrices are written as memory maps to "<path>_min.npy" and "<path>_max.npy" with the reaction IDs and sample names in the sidecar files "<file>.json" (like omicsMapper.mapExpressionStream()) and the pandas.DataFrames are views of the memory maps - the files can be opened again with matrixIO.openMatrix()
+        @ dtype - the type of the values, e.g. "float32"
+        Other arguments see iterCohortFVA().
+        '''
+        if type(samples) != dict:
+            samples = {i : x for i,x in enumerate(samples)}
+        if reactions is None:
+            reactions = [x.id for x in model.reactions]
+        reactions = list(reactions)
+        names = list(samples.keys())
+        column = {x:i for i,x in enumerate(names)}
+
+        mats = []
+        for bound in ["min", "max"]:
+            if path is None:
+                mats.append(np.zeros((len(reactions), len(names)), dtype = dtype))
+            else:
+                sink = path + "_" + bound + ".npy"
+                mats.append(np.lib.format.open_memmap(sink, mode = "w+", dtype = dtype, shape = (len(reactions), len(names))))
+                writeSidecar(sink, reactions, names)
+        min_ar, max_ar = mats
+
+        tic = time.perf_counter()
+        for i, (name, mins, maxs, runtime, error) in enumerate(self.iterCohortFVA(model, samples, reactions = reactions, fraction_of_optimum = fraction_of_optimum, num_cores = num_cores)):
+            if error is None:
+                min_ar[:,column[name]] = mins
+                max_ar[:,column[name]] = maxs
+                self.failed.pop(name, None)
+                print("# [{i}/{n}] FVA for {name} was done in {tictoc}s".format(i = str(i+1),
+                    n = str(len(names)),
+                    name = str(name),
+                    tictoc = str(round(runtime,3))))
+            else:
+                min_ar[:,column[name]] = np.nan
+                max_ar[:,column[name]] = np.nan
+                self.failed[name] = error
+                print("# [{i}/{n}] FVA for {name} failed: {error}".format(i = str(i+1),
+                    n = str(len(names)),
+                    name = str(name),
+                    error = error))
+        toc = time.perf_counter()
+        print("# Total runtime: " + str(round(toc-tic,3)) + "s")
+        if len([x for x in names if x in self.failed]) > 0:
+            warnings.warn("WARNING: FVA failed for {n} samples, see self.failed".format(n = str(len([x for x in names if x in self.failed]))))
+
+        if path is not None:
+            min_ar.flush()
+            max_ar.flush()
+        min_mat = pd.DataFrame(min_ar, index = reactions, columns = names, copy = False)
+        max_mat = pd.DataFrame(max_ar, index = reactions, columns = names, copy = False)
+        return(min_mat, max_mat)
+
+
+class condensedDist:
+    '''The distances of all sample pairs for each reaction in the condensed form of scipy.spatial.distance.pdist - only the upper triangle of each samples x samples matrix is stored, as array with reactions in rows and sample pairs in columns, which needs less than half of the memory of the full array of FVAjuggler.calcFVAdist(). If a path is given, the array is a memory map of a ".npy" file and the reaction and sample names are stored in the sidecar file "<path>.json" (like omicsMapper.mapExpressionStream()), the file can be opened again with FVAjuggler.loadDist().
+    @ index - the names of the reactions
+    @ columns - the names of the samples
+    @ path - the ".npy" file, if None the array is kept in memory
+    @ dtype - "float64" or "float32"
+    @ array - the (reactions x pairs) array, used instead of creating a new one (see FVAjuggler.loadDist())
+    '''
+    def __init__(self, index, columns, path = None, dtype = "float64", array = None):
+        self.name = "condensedDist"
+        self.index = list(index)
+        self.columns = list(columns)
+        self.path = path
+        samples = len(self.columns)
+        self.n_pairs = samples*(samples-1)//2
+        if array is None:
+            if path is None:
+                array = np.zeros((len(self.index), self.n_pairs), dtype = dtype)
+            else:
+                array = np.lib.format.open_memmap(path, mode = "w+", dtype = dtype, shape = (len(self.index), self.n_pairs))
+                writeSidecar(path, self.index, self.columns)
+        self.array = array
+        self.shape = (samples, samples, len(self.index))
+
+    def rxnIdx(self, rxn):
+        ''' returns the row of a reaction - rxn is either the reaction name or the index of the reaction'''
+        if rxn in self.index:
+            rxn = self.index.index(rxn)
+        return(rxn)
+
+    def sampleIdx(self, sample):
+        ''' returns the position of a sample - sample is either the sample name or the index of the sample'''
+        if sample in self.columns:
+            sample = self.columns.index(sample)
+        return(sample)
+
+    def pairIdx(self, sample1, sample2):
+        ''' returns the column of a sample pair in the condensed array'''
+        i, j = sorted([self.sampleIdx(sample1), self.sampleIdx(sample2)])
+        if i == j:
+            raise ValueError("sample1 and sample2 must be different samples")
+        n = len(self.columns)
+        return(n*i - i*(i+1)//2 + j - i - 1)
+
+    def rxnDist(self, rxn, square = False):
+        ''' returns the distances of all sample pairs for a reaction - as condensed vector (e.g. for scipy.cluster.hierarchy.linkage()) or as samples x samples pandas.DataFrame if square is True'''
+        dist = np.asarray(self.array[self.rxnIdx(rxn),:])
+        if square:
+            return(pd.DataFrame(spd.squareform(dist, checks = False), index = self.columns, columns = self.columns))
+        return(dist)
+
+    def pairDist(self, sample1, sample2):
+        ''' returns the distances of two samples for all reactions as pandas.Series'''
+        if self.sampleIdx(sample1) == self.sampleIdx(sample2):
+            return(pd.Series(np.zeros(len(self.index), dtype = self.array.dtype), index = self.index))
+        return(pd.Series(np.asarray(self.array[:,self.pairIdx(sample1, sample2)]), index = self.index))
+
+    def to_array(self):
+        ''' returns the full (samples x samples x reactions) array like FVAjuggler.calcFVAdist()'''
+        samples = len(self.columns)
+        d3 = np.zeros(self.shape, dtype = self.array.dtype)
+        i,j = np.triu_indices(samples, 1)
+        d3[i,j,:] = d3[j,i,:] = np.asarray(self.array).transpose()
+        return(d3)
+
+    def flush(self):
+        ''' writes the changes of the memory map to the file'''
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
 
 
 ## testing stuff
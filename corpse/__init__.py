@@ -1,4 +1,5 @@
 from corpse.omicsMapper import omicsMapper
 from corpse.coreSetFinder import coreSetFinder
 from corpse.FVAjuggler import FVAjuggler
-from corpse.simpleFastcore import simpleFastcore
+from corpse.simpleFastcore import simpleFastcore, batchFastcore
+from corpse.matrixIO import matrixFile, writeMatrix, openMatrix
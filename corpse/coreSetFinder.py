@@ -5,6 +5,7 @@ import warnings
 import pandas as pd
 import numpy as np
 import re
+from corpse.matrixIO import asFrame
 
 class coreSetFinder:
     def __init__(self):
@@ -15,18 +16,132 @@ class coreSetFinder:
             global_lower = 0,
             global_upper = None,
             local = None,
-            subset = None):
+            subset = None,
+            compact = False):
         '''calculate the genes/rxns which are considered expressed in a sample
-        @array = pandas.DataFrame - contains the expression/activity values for each gene/rxn (row) and sample (column) - should contain only expression values and gene names as index and sample names as columnnames.
+        @array = pandas.DataFrame (or matrixIO.matrixFile) - contains the expression/activity values for each gene/rxn (row) and sample (column) - should contain only expression values and gene names as index and sample names as columnnames.
         @global_lower = float[0-100] - defines the global lower threshold as percentile from the whole data set, genes/rxn which have an expression/activity lower than this threshold are considered inactive.
         @global_upper = float[0-100, > global_lower] - defines the global upper threshold for genes/rxns expression/activity as percentile of the whole data set, genes/rxns which have an expression/activity higher than this value are considered always active. If = None, this threshold will be not employed (genes are considered active either depending on the local and/or on the global_lower threshold). If the global_upper threshold is employed, the local threshold can not = None  -> will be automatically set to 50.
         @local = float[0-100, global_lower < local < global_upper] - defines a local expression/activity threshold as percentile which is calculated individually for each gene/rxn across the data set. Genes which have an higher expression will be considered active, if expression > global_lower, conversely genes/rxn with expression/activity < local will be considered inactive, if expression/activity < global_upper.
         @subset = list - defines either the indeces or index names of the array rows to subset the data set to only those genes/rxns in the list (to subset only metabolic active genes for example)
+        @compact = bool - if True, the result is returned as packedCoreSet, which stores the 0/1 values as bits instead of a pandas.DataFrame of integers
 
-        Value: a pandas.DataFrame of the same dimension than the input array (or the subset of it) with containing 0 if the gene/rxn in that sample is inactive or 1 if its active. Additionally a string containing a summary of thresholds applied.
+        Value: a pandas.DataFrame of the same dimension than the input array (or the subset of it) with containing 0 if the gene/rxn in that sample is inactive or 1 if its active (or a packedCoreSet if compact = True). Additionally a string containing a summary of thresholds applied.
         '''
         
         # sanity check
+        global_lower, global_upper, local = self.checkThresholds(global_lower, global_upper, local)
+        
+        # subset data if necessary
+        array = self.subsetArray(array, subset)
+
+        # test the lower threshold
+        values = np.array(array)
+        glt = np.percentile(values, global_lower)
+        res = values > glt
+        
+        # if there is a local treshold, test for it - the percentiles of all genes/rxns are calculated at once
+        if local != None:
+            localt = np.percentile(values, local, axis = 1, keepdims = True)
+            res = res & (values > localt)
+
+        # if there is a global upper threshold, test for it
+        if global_upper != None:
+            gut = np.percentile(values, global_upper)
+            res = res | (values > gut)
+        
+        # create the string
+        out_string = self.thresholdString(global_lower, global_upper, local)
+        
+        if compact:
+            return packedCoreSet(res, index = array.index, columns = array.columns), out_string
+        resDF = pd.DataFrame(res, index = array.index, columns = array.columns)
+        return resDF.astype(int), out_string
+
+    def sweepCoreSets(self,
+            array,
+            global_lower = [0],
+            global_upper = [None],
+            local = [None],
+            subset = None,
+            counts = False,
+            lazy = False,
+            compact = False):
+        '''calculates the core sets of getCoreSet() for all combinations of the given thresholds. All global and all local percentiles are calculated in one call of np.percentile each, which partitions the data only once for all thresholds, so scanning many threshold settings costs about as much as a single getCoreSet() call.
+        @array = pandas.DataFrame (or matrixIO.matrixFile) - contains the expression/activity values for each gene/rxn (row) and sample (column), see getCoreSet()
+        @global_lower, global_upper, local = lists of thresholds, see getCoreSet() - None can be used in the lists of global_upper and local to skip the threshold
+        @subset = list - see getCoreSet()
+        @counts = bool - if True, only the number of active genes/rxns per sample is returned for each setting instead of the complete core sets
+        @lazy = bool - if True, a generator is returned which calculates the results setting by setting instead of all at once
+        @compact = bool - if True (and counts = False), the core set of each setting is returned as packedCoreSet and the results are a list of packedCoreSets instead of the stacked array
+
+        Value: if lazy = False a tuple of the results and a list of the strings summarizing the thresholds of each setting (see getCoreSet()). If counts = False, the results are a boolean numpy.array of the dimension settings x genes/rxns x samples, otherwise a pandas.DataFrame with the settings in rows and the samples in columns containing the number of active genes/rxns. If lazy = True a generator of (result, string) tuples is returned, where result is the boolean genes/rxns x samples numpy.array or the number of active genes/rxns per sample of a single setting.
+        '''
+        array = self.subsetArray(array, subset)
+        values = np.array(array)
+
+        # check all combinations of thresholds
+        settings = []
+        for gl in global_lower:
+            for l in local:
+                for gu in global_upper:
+                    setting = self.checkThresholds(gl, gu, l)
+                    if setting not in settings:
+                        settings.append(setting)
+
+        # get all thresholds at once - same percentiles as in getCoreSet()
+        globals_q = sorted(set([x[0] for x in settings] + [x[1] for x in settings if x[1] != None]))
+        locals_q = sorted(set([x[2] for x in settings if x[2] != None]))
+        global_t = dict(zip(globals_q, np.percentile(values, globals_q)))
+        local_t = {}
+        if len(locals_q) > 0:
+            local_t = dict(zip(locals_q, np.percentile(values, locals_q, axis = 1)))
+
+        def generator():
+            for gl, gu, l in settings:
+                res = values > global_t[gl]
+                if l != None:
+                    res = res & (values > local_t[l][:,None])
+                if gu != None:
+                    res = res | (values > global_t[gu])
+                if counts:
+                    res = res.sum(axis = 0)
+                elif compact:
+                    res = packedCoreSet(res, index = array.index, columns = array.columns)
+                yield(res, self.thresholdString(gl, gu, l))
+
+        if lazy:
+            return(generator())
+
+        results = list(generator())
+        strings = [x[1] for x in results]
+        if counts:
+            results = pd.DataFrame(np.array([x[0] for x in results]).reshape((len(strings), values.shape[1])), index = strings, columns = array.columns)
+        elif compact:
+            results = [x[0] for x in results]
+        else:
+            results = np.array([x[0] for x in results]).reshape((len(strings),) + values.shape)
+        return(results, strings)
+
+    def loadCoreSet(self, path):
+        ''' loads a packedCoreSet which was saved with packedCoreSet.save()'''
+        with np.load(path) as data:
+            return(packedCoreSet(bits = data["bits"], index = data["index"].tolist(), columns = data["columns"].tolist(), rows = int(data["rows"])))
+
+    def thresholdString(self, global_lower, global_upper = None, local = None):
+        ''' creates the string summarizing the thresholds applied by getCoreSet()'''
+        if local != None:
+            local_string = "L"+re.sub("\.0$","",str(local))
+        else:
+            local_string = ""
+        if global_upper != None:
+            gu_string = "GU" + re.sub("\.0$","",str(global_upper))
+        else:
+            gu_string = ""
+        return(re.sub("\|+$","","|".join(["GL" +  re.sub("\.0$","",str(global_lower)) ,local_string, gu_string])))
+
+    def checkThresholds(self, global_lower = 0, global_upper = None, local = None):
+        ''' checks the thresholds for getCoreSet() and returns the thresholds which will be used as tuple of (global_lower, global_upper, local) - thresholds which can not be applied are set to None with a warning'''
         if global_lower == None or global_lower < 0 or global_lower > 100:
             raise ValueError("Global lower threshold must be an integer between 0 and 100")
 
@@ -49,10 +164,12 @@ class coreSetFinder:
             elif local > 100:
                 warnings.warn("Local threshold must be <= 100 - will not use local threshold")
                 local = None
-                
-            
-        
-        # subset data if necessary
+
+        return(global_lower, global_upper, local)
+
+    def subsetArray(self, array, subset = None):
+        ''' subsets the rows of the array for getCoreSet() - subset is a list of either the indeces, index names or booleans for the rows of the array. matrixFiles and paths of matrix files (see matrixIO.writeMatrix()) are opened as pandas.DataFrame.'''
+        array = asFrame(array)
         if subset != None:
             if type(subset[0]) == str:
                 subset = [x for x in subset if x in array.index]
@@ -63,31 +180,60 @@ class coreSetFinder:
             elif type(subset[0]) == bool:
                 subset = subset[0:array.shape[0]]
                 array = array[subset]
+        return(array)
 
-        # test the lower threshold
-        glt = np.percentile(np.array(array), global_lower)
-        resDF = array > glt   
-        
-        # if there is a local treshold, test for it
-        if local != None:
-            local_string = "L"+re.sub("\.0$","",str(local))
-            for gene in array.index:
-                localt = np.percentile(array.loc[gene], local)
-                colVals = [True if all([x,y]) else False for x,y in zip(array.loc[gene] > localt,resDF.loc[gene])]
-                resDF.loc[gene,:] = colVals
-        else:
-            local_string = ""
 
-        # if there is a global upper threshold, test for it
-        if global_upper != None:
-            gu_string = "GU" + re.sub("\.0$","",str(global_upper))
-            gut = np.percentile(np.array(array), global_upper)
-            upperArray = array > gut
-            resDF[upperArray] = True
-        else:
-            gu_string = ""
-        
-        # create the string
-        out_string = re.sub("\|+$","","|".join(["GL" +  re.sub("\.0$","",str(global_lower)) ,local_string, gu_string]))
-        
-        return resDF.astype(int), out_string
+class packedCoreSet:
+    '''A compact representation of the 0/1 results of coreSetFinder.getCoreSet() - the values of each sample are packed into bits (np.packbits), which needs 1/64 of the memory of the integer pandas.DataFrame. The core set of each sample can be extracted directly from the bits and the complete pandas.DataFrame is only created on request.
+    @mask = numpy.array - boolean array with genes/rxns in rows and samples in columns
+    @index = list - the names of the genes/rxns
+    @columns = list - the names of the samples
+    @bits, rows = the packed bits (samples x bytes) and the number of genes/rxns - used instead of mask to create the object from packed data (see coreSetFinder.loadCoreSet())
+    '''
+    def __init__(self, mask = None, index = None, columns = None, bits = None, rows = None):
+        self.name = "packedCoreSet"
+        if mask is not None:
+            mask = np.asarray(mask, dtype = bool)
+            rows = mask.shape[0]
+            # each sample is packed into one contiguous row of bytes
+            bits = np.packbits(mask.transpose(), axis = 1)
+        self.bits = bits
+        self.rows = rows
+        self.index = list(range(rows)) if index is None else list(index)
+        self.columns = list(range(self.bits.shape[0])) if columns is None else list(columns)
+        self.shape = (self.rows, len(self.columns))
+
+    def sampleBits(self, sample):
+        ''' returns the boolean values of a sample - sample is either the sample name or the index of the sample'''
+        if sample in self.columns:
+            sample = self.columns.index(sample)
+        return(np.unpackbits(self.bits[sample], count = self.rows).astype(bool))
+
+    def core_idx(self, sample):
+        ''' returns the indeces of the active genes/rxns of a sample - sample is either the sample name or the index of the sample'''
+        return(np.flatnonzero(self.sampleBits(sample)).tolist())
+
+    def core_set(self, sample):
+        ''' returns the names of the active genes/rxns of a sample (e.g. to use it as core_set in simpleFastcore) - sample is either the sample name or the index of the sample'''
+        return([self.index[i] for i in self.core_idx(sample)])
+
+    def counts(self):
+        ''' returns the number of active genes/rxns for each sample as pandas.Series'''
+        counts = np.unpackbits(self.bits, axis = 1, count = self.rows).sum(axis = 1)
+        return(pd.Series(counts, index = self.columns))
+
+    def to_array(self):
+        ''' returns the boolean numpy.array with genes/rxns in rows and samples in columns'''
+        return(np.unpackbits(self.bits, axis = 1, count = self.rows).astype(bool).transpose())
+
+    def to_frame(self):
+        ''' returns the pandas.DataFrame with 0/1 values as returned by coreSetFinder.getCoreSet()'''
+        return(pd.DataFrame(self.to_array(), index = self.index, columns = self.columns).astype(int))
+
+    def save(self, path):
+        ''' saves the packed bits and the names of the genes/rxns and samples to a numpy ".npz" file, load it with coreSetFinder.loadCoreSet()'''
+        np.savez(path,
+                bits = self.bits,
+                rows = self.rows,
+                index = np.array([str(x) for x in self.index]),
+                columns = np.array([str(x) for x in self.columns]))
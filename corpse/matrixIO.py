@@ -0,0 +1,181 @@
+# reading and writing of the matrices used in corpse (expression, RAS, core sets, FVA) in binary formats
+
+import numpy as np
+import pandas as pd
+import json
+import os
+from contextlib import contextmanager
+
+# the supported file types
+formats = {".npy" : "npy", ".parquet" : "parquet", ".feather" : "feather"}
+
+def fileFormat(path):
+    ''' returns the format of a file by its extension - one of "npy", "parquet" or "feather", None for other files'''
+    for extension, name in formats.items():
+        if path.lower().endswith(extension):
+            return(name)
+    return(None)
+
+def readSidecar(path):
+    ''' reads the row and column names of a matrix file from its sidecar file "<path>.json" - returns an empty dictionary if there is no sidecar'''
+    try:
+        with open(path + ".json") as fh:
+            return(json.load(fh))
+    except FileNotFoundError:
+        return({})
+
+def writeSidecar(path, index, columns):
+    ''' writes the row and column names of a matrix file to its sidecar file "<path>.json"'''
+    with open(path + ".json", "w") as fh:
+        json.dump({"index" : [str(x) for x in index], "columns" : [str(x) for x in columns]}, fh)
+
+@contextmanager
+def atomicWrite(path):
+    ''' yields the name of a temporary file to write to instead of path - the file is moved to path only if the block finished without error, so that other processes never read incomplete files'''
+    tmp = path + "." + str(os.getpid()) + ".tmp"
+    try:
+        yield(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def writeMatrix(data, path, index = None, columns = None):
+    ''' writes a matrix to a binary file and returns the matrixFile of it - the type is chosen by the extension of path: ".npy" (numpy, can be opened as memory map), ".parquet" or ".feather" (columnar, need pyarrow). The row and column names are stored in the sidecar file "<path>.json".
+    @ data - pandas.DataFrame, numpy.array or any object with a to_frame() method (matrixFile, coreSetFinder.packedCoreSet)
+    @ index, columns - the row and column names for numpy arrays, default are the row and column numbers
+    '''
+    fmt = fileFormat(path)
+    if fmt is None:
+        raise ValueError("Unknown file type of {path} - use npy, parquet or feather files".format(path = path))
+    if not isinstance(data, (pd.DataFrame, np.ndarray)) and hasattr(data, "to_frame"):
+        data = data.to_frame()
+    if isinstance(data, pd.DataFrame):
+        index = data.index if index is None else index
+        columns = data.columns if columns is None else columns
+        values = data.values
+    else:
+        values = np.asarray(data)
+    index = list(range(values.shape[0])) if index is None else list(index)
+    columns = list(range(values.shape[1])) if columns is None else list(columns)
+
+    with atomicWrite(path) as tmp:
+        if fmt == "npy":
+            with open(tmp, "wb") as fh:
+                np.save(fh, values)
+        else:
+            import pyarrow as pa
+            # the columns are named by their position, the names are in the sidecar
+            table = pa.table({str(j) : values[:,j] for j in range(values.shape[1])})
+            if fmt == "parquet":
+                import pyarrow.parquet as pq
+                pq.write_table(table, tmp)
+            else:
+                import pyarrow.feather as pf
+                # uncompressed feather files can be memory mapped
+                pf.write_feather(table, tmp, compression = "uncompressed")
+        writeSidecar(path, index, columns)
+    return(matrixFile(path))
+
+def openMatrix(path):
+    ''' returns the matrixFile of a file written with writeMatrix() (or omicsMapper.mapExpressionStream(), FVAjuggler.cohortFVA())'''
+    return(matrixFile(path))
+
+def asFrame(data):
+    ''' returns a pandas.DataFrame for a matrixFile or the path of a matrix file (see writeMatrix()) - all other data is returned unchanged. ".npy" files are not read, the pandas.DataFrame is a view of the memory map.'''
+    if type(data) == str and fileFormat(data) is not None:
+        data = matrixFile(data)
+    if isinstance(data, matrixFile):
+        return(data.to_frame())
+    return(data)
+
+
+class matrixFile:
+    '''A handle of a matrix stored in a binary file (see writeMatrix()) - only the row and column names are read when the handle is created, the values are read on request: ".npy" files are opened as memory map, parquet and feather files are read column by column. A matrixFile can be used instead of a pandas.DataFrame as input of omicsMapper, coreSetFinder, batchFastcore and FVAjuggler.
+    @ path - the ".npy", ".parquet" or ".feather" file - the row and column names are taken from the sidecar file "<path>.json", if there is none the row and column numbers are used (for parquet files written by pandas, the names of the pandas metadata are used)
+    '''
+    def __init__(self, path):
+        self.name = "matrixFile"
+        self.path = path
+        self.format = fileFormat(path)
+        if self.format is None:
+            raise ValueError("Unknown file type of {path} - use npy, parquet or feather files".format(path = path))
+        names = readSidecar(path)
+        index = names.get("index")
+        columns = names.get("columns")
+        if self.format == "npy":
+            shape = np.load(path, mmap_mode = "r").shape
+            self.fields = None
+        else:
+            schema = self.schema()
+            pandas_index = [x for x in (schema.pandas_metadata or {}).get("index_columns", []) if type(x) == str]
+            self.fields = [x for x in schema.names if x not in pandas_index]
+            if columns is None:
+                columns = list(self.fields)
+            if index is None and len(pandas_index) > 0:
+                index = list(pd.read_parquet(path, columns = pandas_index).index) if self.format == "parquet" else None
+            shape = (self.numRows(), len(self.fields))
+        self.index = list(range(shape[0])) if index is None else list(index)
+        self.columns = list(range(shape[1])) if columns is None else list(columns)
+        self.shape = (len(self.index), len(self.columns))
+
+    def schema(self):
+        ''' returns the pyarrow schema of parquet and feather files'''
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+            return(pq.read_schema(self.path))
+        import pyarrow.feather as pf
+        return(pf.read_table(self.path, memory_map = True).schema)
+
+    def numRows(self):
+        ''' returns the number of rows of parquet and feather files without reading the values'''
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+            return(pq.ParquetFile(self.path).metadata.num_rows)
+        import pyarrow.feather as pf
+        return(pf.read_table(self.path, memory_map = True).num_rows)
+
+    def columnIdx(self, columns = None):
+        ''' returns the positions of the columns - columns is a list of column names (strings) or positions (integers), all columns if None'''
+        if columns is None:
+            return(list(range(len(self.columns))))
+        return([self.columns.index(x) if type(x) == str else int(x) for x in columns])
+
+    def array(self, columns = None):
+        ''' returns the values as numpy.array - for ".npy" files the memory map itself if all columns are requested
+        @ columns - list of column names (strings) or positions (integers), all columns if None'''
+        if self.format == "npy":
+            values = np.load(self.path, mmap_mode = "r")
+            if columns is None:
+                return(values)
+            return(np.array(values[:,self.columnIdx(columns)]))
+        fields = [self.fields[j] for j in self.columnIdx(columns)]
+        if len(fields) == 0:
+            return(np.zeros((self.shape[0], 0)))
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+            table = pq.read_table(self.path, columns = fields)
+        else:
+            import pyarrow.feather as pf
+            table = pf.read_table(self.path, columns = fields, memory_map = True)
+        return(np.column_stack([table.column(x).to_numpy() for x in fields]))
+
+    def to_frame(self, columns = None):
+        ''' returns the values as pandas.DataFrame - for ".npy" files a view of the memory map if all columns are requested
+        @ columns - list of column names (strings) or positions (integers), all columns if None'''
+        idx = self.columnIdx(columns)
+        return(pd.DataFrame(self.array(columns), index = self.index, columns = [self.columns[j] for j in idx], copy = False))
+
+    def columnChunks(self, chunk_size = 500):
+        ''' returns a generator of pandas.DataFrames with chunk_size columns each, only the current chunk is read into memory'''
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer")
+        for start in range(0, len(self.columns), chunk_size):
+            stop = min(start + chunk_size, len(self.columns))
+            yield(self.to_frame(columns = list(range(start, stop))))
+
+    def __array__(self, dtype = None):
+        values = self.array()
+        if dtype is not None:
+            values = values.astype(dtype)
+        return(values)
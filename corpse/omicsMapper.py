@@ -7,16 +7,24 @@ import numpy as np
 import warnings
 import multiprocessing
 import joblib
+import scipy.sparse as sps
+import hashlib
+import os
+import tempfile
+from corpse.matrixIO import matrixFile, asFrame, atomicWrite, fileFormat, readSidecar, writeSidecar
 
 class omicsMapper:
     def __init__(self):
         self.name = "omicsMapper"
+        self.gpr_cache = {} # compiled GPRs keyed by (gpr, orIsSum), see compileGPR()
+        self.sparse_cache = {} # sparse GPR representations of models, see compileSparse()
+        self.align_cache = {} # positions of the model genes in the expression data, see alignIndex()
 
     def parseData(self, model, dataframe, column = 0, protein = False):
         '''Takes a pandas.DataFrame with gene/protein expression data and a cobra.Model and extracts only those data in the DataFrame where the gene/protein ids of the model matches the index of the data frame and returns the values in a dic with index:value pairs.
     Keyword arguments:
         @ model - a cobra.Model object representing the metabolic model
-        @ dataframe - a pandas.DataFrame containing the expression data, the index should correspond to the gene/protein names in the metabolic model
+        @ dataframe - a pandas.DataFrame containing the expression data, the index should correspond to the gene/protein names in the metabolic model - can also be a matrixIO.matrixFile or the path of a ".npy", ".parquet" or ".feather" file written with matrixIO.writeMatrix()
         @ column - index of the column containing the expression data - either an integer corresponding to the column or the column name
         @ protein - whether to map the expression to the gene.ids of the model or to the gene-product - basically a switch between model.gene.id (False, default) and model.gene.name (True).
 
@@ -24,36 +32,70 @@ class omicsMapper:
         A dictionary with gene:value pairs.
         '''
        
-        # get all genes in the model
-        if protein:
-            genes = np.unique([x.name for x in model.genes if x.name in dataframe.index])
-            missing = np.unique([x.name for x in model.genes if x.name not in dataframe.index])
-        else:
-            genes = np.unique([x.id for x in model.genes if x.id in dataframe.index])
-            missing = np.unique([x.id for x in model.genes if x.id not in dataframe.index])
-        
-        
+        # get the position of the model genes in the data frame
+        dataframe = asFrame(dataframe)
+        alignment = self.alignIndex(model, dataframe.index, protein = protein)
+
         # get values from the data frame
         if type(column) == str:
-            df = dataframe.loc[genes,column]
+            values = dataframe[column]
         elif type(column) == int:
-            df = dataframe.loc[genes].iloc[:,column]
+            values = dataframe.iloc[:,column]
         else:
             warnings.warn("column argument was neither integer nor string - try to convert to integer")
             try:
                 column = int(column)
-                df = dataframe.loc[genes].iloc[:,column]
+                values = dataframe.iloc[:,column]
             except:
                 warnings.warn("could not convert columns to integer and extract column from the data frame - will fall back to column = 0")
-                df = dataframe.loc[genes].iloc[:,0]
-        
+                values = dataframe.iloc[:,0]
+        values = values.to_numpy()[alignment["positions"]]
+
         # convert the results into dictionary and add all the missing values with exrpression = 0
-        df = dict(df)
-        for x in missing:
+        df = dict(zip(alignment["genes"][alignment["rows"]].tolist(), values))
+        for x in alignment["missing"]:
             df[x] = 0
         
         return(df)
 
+    def alignIndex(self, model, index, protein = False):
+        '''Finds the positions of the model genes in the index of an expression data frame. The alignment is computed only once for each model and index and then taken from the cache.
+    Keyword arguments:
+        @ model - a cobra.Model object representing the metabolic model
+        @ index - the index of the expression data frame (pandas.Index or list)
+        @ protein - whether to use the gene.ids of the model or the gene-products - basically a switch between model.gene.id (False, default) and model.gene.name (True).
+    Value:
+        A dictionary with the entries:
+            "genes" - the sorted unique genes of the model (see modelGenes())
+            "gene_idx" - a dictionary with gene:row pairs for the genes
+            "rows" - the rows of the genes which are found in the index
+            "positions" - the positions of these genes in the index - if a gene is found multiple times, the last one is used
+            "missing" - the genes which are not found in the index
+        '''
+        genes = self.modelGenes(model, protein = protein)
+        key = (protein, tuple(genes))
+        index = pd.Index(index)
+        cached = self.align_cache.setdefault(key, [])
+        for cached_index, alignment in cached:
+            if cached_index is index or cached_index.equals(index):
+                return(alignment)
+
+        # keep only the last occurence of duplicated genes
+        unique = ~index.duplicated(keep = "last")
+        positions = index[unique].get_indexer(genes)
+        found = positions >= 0
+        positions = np.flatnonzero(unique)[positions]
+        alignment = {"genes" : genes,
+                "gene_idx" : {x:i for i,x in enumerate(genes)},
+                "rows" : np.flatnonzero(found),
+                "positions" : positions[found],
+                "missing" : genes[~found].tolist()}
+
+        # remember only the last few data sets for each model
+        cached.append((index, alignment))
+        if len(cached) > 8:
+            cached.pop(0)
+        return(alignment)
 
     def mapGPR(self, gpr, expression, orIsSum = True):
         '''The function evaluates a GPR exrpession and maps the expression to it.
@@ -177,6 +219,126 @@ class omicsMapper:
         return(val,n)
 
 
+    def buildGPRtree(self, gpr, orIsSum = True):
+        '''Parses a GPR expression into a tree which can be evaluated repeatedly with evalGPRtree() - the parser walks the string exactly like mapGPR() does, but instead of looking up the expression values it records them as leafs of the tree.
+    Keyword arguments:
+        @ gpr - the gene reaction rule to parse
+        @ orIsSum - how should the OR operator of the GPR be handled - if True, the pairs of an OR operator are summed, if False, the maximum value of the two is used
+    Value:
+        Returns two values - the first is the tree, the second value is the length of the GPR in characters (its needed for recursive calls in the function). The tree is either a gene name (str), a constant or a tuple (function, left, right) where function is one of the arguments of compareBinary() and left/right are trees themselves.
+    Note: The GPR is evaluated from left to right, same as in mapGPR().
+        '''
+
+        # sanity check - if string is empty the rule evaluates to 0
+        if gpr == "":
+            return(0,len(gpr))
+
+        n = 0
+        pairs = [None,None] # contains the subtrees which should be compared by an operator
+        word = "" # the gene name in GPR
+        op = "" # contains the operation on the pairs
+        # go through the complete GPR string - see mapGPR() for a description of the parsing
+        while n < len(gpr):
+            if gpr[n] == " ":
+                if word in [""," ","(",")"]:
+                    word = ""
+                else:
+                    if word.lower() == "and":
+                        op = "min"
+                        word = ""
+                    elif word.lower() == "or":
+                        if orIsSum:
+                            op = "sum"
+                        else:
+                            op = "max"
+                        word = ""
+                    else:
+                        if pairs[0] is None:
+                            pairs[0] = word
+                            word = ""
+                        elif pairs[1] is None:
+                            pairs[0] = (op, pairs[0], word)
+                            word = ""
+                            op = ""
+                        else:
+                            warnings.warn("Both pairs are not None and the word {word} was found".format(word = word))
+            elif gpr[n] == ")":
+                # if there is no word saved, the expression was evaluated already
+                if word == "" and op == "":
+                    tree = pairs[0]
+                else:
+                    tree = (op, pairs[0], word)
+                return(tree,n)
+            elif gpr[n] == "(":
+                tree,nn = self.buildGPRtree(gpr = gpr[n+1:], orIsSum = orIsSum)
+                n = n+nn+1 # adjust the counter to after the bracket
+                if pairs[0] is None:
+                    pairs[0] = tree
+                    word = ""
+                elif pairs[1] is None:
+                    pairs[0] = (op, pairs[0], tree)
+                    word = ""
+                    op = ""
+                else:
+                    raise ValueError("found '(' in the GPR but pairs list is already populated")
+            else:
+                word = word + gpr[n]
+
+            n = n+1
+
+        # if only one word is given you end up here with no value in pairs
+        if pairs[0] is None:
+            tree = word
+        # add the final word if not done yet
+        elif word != "":
+            tree = (op, pairs[0], word)
+        else:
+            tree = pairs[0]
+
+        return(tree,n)
+
+    def compileGPR(self, gpr, orIsSum = True):
+        '''Returns the tree of a GPR expression (see buildGPRtree()) - each GPR is parsed only once per omicsMapper object and then taken from the cache
+    Keyword arguments:
+        @ gpr - the gene reaction rule to compile
+        @ orIsSum - how should the OR operator of the GPR be handled - if True, the pairs of an OR operator are summed, if False, the maximum value of the two is used
+        '''
+        key = (gpr, orIsSum)
+        if key not in self.gpr_cache:
+            self.gpr_cache[key] = self.buildGPRtree(gpr = gpr, orIsSum = orIsSum)[0]
+        return(self.gpr_cache[key])
+
+    def compileModel(self, model, protein = False, orIsSum = True):
+        '''Compiles the GPRs of all reactions of a cobra.Model
+    Keyword arguments:
+        @ model - a cobra.Model object representing the metabolic model
+        @ protein - whether to compile the gene.ids of the model or the gene-products - basically a switch between rxn.gene_reaction_rule (False, default) and rxn.gene_name_reaction_rule (True).
+        @ orIsSum - how should the OR operator of the GPR be handled - if True, the pairs of an OR operator are summed, if False, the maximum value of the two is used
+    Value:
+        A dictionary with rxn.id:tree pairs in the order of the model reactions.
+        '''
+        if protein:
+            return({rxn.id : self.compileGPR(rxn.gene_name_reaction_rule, orIsSum = orIsSum) for rxn in model.reactions})
+        else:
+            return({rxn.id : self.compileGPR(rxn.gene_reaction_rule, orIsSum = orIsSum) for rxn in model.reactions})
+
+    def evalGPRtree(self, tree, expression):
+        '''Evaluates a GPR tree created by compileGPR() with the given expression data
+    Keyword arguments:
+        @ tree - the compiled GPR
+        @ expression - a dictionary containing gene:expression value pairs
+    Value:
+        The value of the GPR - identical to the first value returned by mapGPR()
+        '''
+        if type(tree) == tuple:
+            function, left, right = tree
+            pairs = [self.evalGPRtree(left, expression), self.evalGPRtree(right, expression)]
+            return(self.compareBinary(pairs, function = function))
+        elif type(tree) == str:
+            return(expression[tree])
+        else:
+            return(tree)
+
     def compareBinary(self, pairs, function):
         ''' compares two values either by sum, min or max - helper function for evalGPR '''
         if function == "sum":
@@ -192,6 +354,228 @@ class omicsMapper:
         else:
             raise ValueError("Argument '{f}' for function is not defined".format(f = function))
 
+    def compareArrays(self, pairs, function):
+        ''' same as compareBinary() but compares two arrays elementwise - helper function for evalGPRtreeArray() '''
+        # min/max are written with np.where to keep the behaviour of the python builtins, which return the first value unless the second is strictly smaller/larger (that matters for NaN)
+        if function == "sum":
+            return(np.add(pairs[0], pairs[1]))
+        elif function == "min":
+            return(np.where(pairs[1] < pairs[0], pairs[1], pairs[0]))
+        elif function == "max":
+            return(np.where(pairs[1] > pairs[0], pairs[1], pairs[0]))
+        elif function == "":
+            raise ValueError("dont know")
+        else:
+            raise ValueError("Argument '{f}' for function is not defined".format(f = function))
+
+    def evalGPRtreeArray(self, tree, array, gene_idx):
+        '''Evaluates a GPR tree created by compileGPR() for all samples at once
+    Keyword arguments:
+        @ tree - the compiled GPR
+        @ array - a numpy.array with genes in rows and samples in columns
+        @ gene_idx - a dictionary containing gene:row pairs for the array
+    Value:
+        A numpy.array with one value per sample (or a scalar if the GPR is empty)
+        '''
+        if type(tree) == tuple:
+            function, left, right = tree
+            pairs = [self.evalGPRtreeArray(left, array, gene_idx), self.evalGPRtreeArray(right, array, gene_idx)]
+            return(self.compareArrays(pairs, function = function))
+        elif type(tree) == str:
+            return(array[gene_idx[tree]])
+        else:
+            return(tree)
+
+    def modelGenes(self, model, protein = False):
+        ''' returns the sorted unique gene ids (or gene names if protein = True) of the model - this is the row order used by alignData() and compileSparse()'''
+        if protein:
+            return(np.unique([x.name for x in model.genes]))
+        else:
+            return(np.unique([x.id for x in model.genes]))
+
+    def alignData(self, model, dataframe, column = None, protein = False):
+        '''Extracts the expression values of the model genes from the dataframe as a genes x samples numpy.array. Genes which are not in the data frame get expression = 0 and if a gene is found multiple times in the data, the last one is used - same as in parseData().
+    Keyword arguments:
+        @ model - a cobra.Model object representing the metabolic model
+        @ dataframe - a pandas.DataFrame containing the expression data, the index should correspond to the gene/protein names in the metabolic model - can also be a matrixIO.matrixFile or the path of a ".npy", ".parquet" or ".feather" file written with matrixIO.writeMatrix()
+        @ column - a list of indeces for the columns of the dataframe - either as integer corresponding to the column or string of the column name, defaults to all columns
+        @ protein - whether to map the expression to the gene.ids of the model or to the gene-product - basically a switch between model.gene.id (False, default) and model.gene.name (True).
+    Value:
+        The numpy.array and a dictionary with gene:row pairs for the array.
+        '''
+        dataframe = asFrame(dataframe)
+        if column is None:
+            column = list(dataframe.columns)
+
+        alignment = self.alignIndex(model, dataframe.index, protein = protein)
+
+        # extract the genes x samples matrix from the data frame
+        cols = [dataframe.columns.get_loc(x) if type(x) == str else int(x) for x in column]
+        values = dataframe.iloc[:,cols].to_numpy()
+        array = np.zeros((len(alignment["genes"]), len(cols)), dtype = values.dtype)
+        array[alignment["rows"]] = values[alignment["positions"]]
+        return(array, alignment["gene_idx"])
+
+    def mapArrayToModel(self, model, dataframe, column = None, protein = False, orIsSum = True, compiled = None):
+        '''Maps all columns of the dataframe to the reactions of the model in a single pass. Instead of evaluating the GPRs sample by sample, each GPR is evaluated on complete rows of the genes x samples matrix with numpy - the result is identical to calling mapSampleToModel() for each column.
+    Keyword arguments:
+        @ model - a cobra.Model object representing the metabolic model
+        @ dataframe - a pandas.DataFrame containing the expression data, the index should correspond to the gene/protein names in the metabolic model - can also be a matrixIO.matrixFile or the path of a ".npy", ".parquet" or ".feather" file written with matrixIO.writeMatrix()
+        @ column - a list of indeces for the columns of the dataframe - either as integer corresponding to the column or string of the column name, defaults to all columns
+        @ protein - whether to map the expression to the gene.ids of the model or to the gene-product - basically a switch between model.gene.id (False, default) and model.gene.name (True).
+        @ orIsSum - how should the OR operator of the GPR be handled - if True, the pairs of an OR operator are summed, if False, the maximum value of the two is used
+        @ compiled - the result of compileModel(), will be created if None
+    Value:
+        A numpy.array with reactions in rows and samples in columns.
+        '''
+        if compiled is None:
+            compiled = self.compileModel(model, protein = protein, orIsSum = orIsSum)
+        array, gene_idx = self.alignData(model, dataframe, column = column, protein = protein)
+        return(self.evalCompiledArray(compiled, array, gene_idx))
+
+    def evalCompiledArray(self, compiled, array, gene_idx):
+        ''' evaluates all GPRs of compileModel() on the whole genes x samples array (see alignData()) and returns a reactions x samples numpy.array'''
+        vals = [np.broadcast_to(self.evalGPRtreeArray(tree, array, gene_idx), (array.shape[1],)) for tree in compiled.values()]
+        if len(vals) == 0:
+            return(np.zeros((0, array.shape[1]), dtype = array.dtype))
+        return(np.vstack(vals))
+
+    def evalCompiledSamples(self, compiled, array, gene_idx):
+        ''' evaluates all GPRs of compileModel() for each column of the genes x samples array (see alignData()) separately with evalGPRtree() and returns a reactions x samples numpy.array'''
+        results = []
+        for j in range(array.shape[1]):
+            expression = dict(zip(gene_idx.keys(), array[:,j]))
+            results.append([self.evalGPRtree(tree, expression = expression) for tree in compiled.values()])
+        return(np.array(results).reshape((array.shape[1], len(compiled))).transpose())
+
+    def flattenGPRtree(self, tree):
+        ''' returns the function and the list of genes of a GPR tree if the tree uses only a single function (e.g. only "or" or only "and"), a single gene is returned as ("sum", [gene]) - for nested GPRs (None, None) is returned'''
+        if type(tree) == str:
+            return("sum", [tree])
+        if type(tree) != tuple or tree[0] not in ["sum", "min", "max"]:
+            return(None, None)
+        function = tree[0]
+        genes = []
+        stack = [tree]
+        while len(stack) > 0:
+            node = stack.pop()
+            if type(node) == str:
+                genes.append(node)
+            elif type(node) == tuple and node[0] == function:
+                stack.extend([node[2], node[1]])
+            else:
+                return(None, None)
+        return(function, genes)
+
+    def compileSparse(self, model, protein = False, orIsSum = True, compiled = None):
+        '''Lowers the GPRs of the model to sparse gene-reaction incidence structures, which are used by mapSparseToModel(). The representation is built only once per model and protein/orIsSum setting and then taken from the cache.
+    Keyword arguments:
+        @ model - a cobra.Model object representing the metabolic model
+        @ protein - whether to map the expression to the gene.ids of the model or to the gene-product - basically a switch between model.gene.id (False, default) and model.gene.name (True).
+        @ orIsSum - how should the OR operator of the GPR be handled - if True, the pairs of an OR operator are summed, if False, the maximum value of the two is used
+        @ compiled - the result of compileModel(), will be created if None
+    Value:
+        A dictionary with the entries:
+            "reactions" - the number of reactions
+            "sum" - (reaction rows, scipy.sparse.csr_matrix reactions x genes) for single genes and pure sum-OR GPRs
+            "min"/"max" - (reaction rows, gene rows, segment starts) for pure AND GPRs and pure max-OR GPRs
+            "nested" - (reaction rows, trees) for all other GPRs, which are evaluated with evalGPRtreeArray()
+            "empty" - reaction rows without GPR
+        '''
+        if compiled is None:
+            compiled = self.compileModel(model, protein = protein, orIsSum = orIsSum)
+        genes = self.modelGenes(model, protein = protein)
+        key = (protein, orIsSum, tuple(genes), tuple(compiled.items()))
+        if key in self.sparse_cache:
+            return(self.sparse_cache[key])
+
+        gene_idx = {x:i for i,x in enumerate(genes)}
+        groups = {"sum" : [], "min" : [], "max" : [], "nested" : [], "empty" : []}
+        for i,tree in enumerate(compiled.values()):
+            if type(tree) != tuple and type(tree) != str and tree == 0:
+                groups["empty"].append(i)
+                continue
+            function, leafs = self.flattenGPRtree(tree)
+            if function is None:
+                groups["nested"].append((i, tree))
+            else:
+                groups[function].append((i, [gene_idx[x] for x in leafs]))
+
+        sparse = {"reactions" : len(compiled),
+                "empty" : np.array(groups["empty"], dtype = int),
+                "nested" : ([x[0] for x in groups["nested"]], [x[1] for x in groups["nested"]])}
+
+        # OR-sum (and single genes) is a matrix product with the incidence matrix
+        rows = [x[0] for x in groups["sum"]]
+        row_idx = np.repeat(np.arange(len(rows)), [len(x[1]) for x in groups["sum"]])
+        col_idx = np.array([g for x in groups["sum"] for g in x[1]], dtype = int)
+        # duplicated genes in one GPR are summed up by the csr_matrix, same as in the GPR itself
+        incidence = sps.csr_matrix((np.ones(len(col_idx), dtype = np.int64), (row_idx, col_idx)), shape = (len(rows), len(genes)))
+        sparse["sum"] = (np.array(rows, dtype = int), incidence)
+
+        # AND and OR-max are segmented reductions over the gene rows of each GPR
+        for function in ["min", "max"]:
+            rows = [x[0] for x in groups[function]]
+            gene_rows = np.array([g for x in groups[function] for g in x[1]], dtype = int)
+            starts = np.cumsum([0] + [len(x[1]) for x in groups[function]])[:-1]
+            sparse[function] = (np.array(rows, dtype = int), gene_rows, starts)
+
+        self.sparse_cache[key] = sparse
+        return(sparse)
+
+    def mapSparseToModel(self, model, dataframe, column = None, protein = False, orIsSum = True, compiled = None):
+        '''Maps all columns of the dataframe to the reactions of the model by means of the sparse incidence structures of compileSparse(). Single genes and OR-sum GPRs are a sparse matrix product, pure AND and OR-max GPRs a segmented reduction and only the nested GPRs are evaluated with evalGPRtreeArray().
+    Keyword arguments:
+        @ model - a cobra.Model object representing the metabolic model
+        @ dataframe - a pandas.DataFrame containing the expression data, the index should correspond to the gene/protein names in the metabolic model - can also be a matrixIO.matrixFile or the path of a ".npy", ".parquet" or ".feather" file written with matrixIO.writeMatrix()
+        @ column - a list of indeces for the columns of the dataframe - either as integer corresponding to the column or string of the column name, defaults to all columns
+        @ protein - whether to map the expression to the gene.ids of the model or to the gene-product - basically a switch between model.gene.id (False, default) and model.gene.name (True).
+        @ orIsSum - how should the OR operator of the GPR be handled - if True, the pairs of an OR operator are summed, if False, the maximum value of the two is used
+        @ compiled - the result of compileModel(), will be created if None
+    Value:
+        A numpy.array with reactions in rows and samples in columns.
+    Note: The result equals mapArrayToModel() up to the order of floating point summation, except for NaN values, which always propagate through the GPR here.
+        '''
+        if compiled is None:
+            compiled = self.compileModel(model, protein = protein, orIsSum = orIsSum)
+        sparse = self.compileSparse(model, protein = protein, orIsSum = orIsSum, compiled = compiled)
+        array, gene_idx = self.alignData(model, dataframe, column = column, protein = protein)
+        return(self.evalCompiledSparse(sparse, array, gene_idx))
+
+    def evalCompiledSparse(self, sparse, array, gene_idx):
+        ''' evaluates the sparse GPR representation of compileSparse() on the whole genes x samples array (see alignData()) and returns a reactions x samples numpy.array'''
+        dtype = np.result_type(array.dtype, 0)
+        results = np.zeros((sparse["reactions"], array.shape[1]), dtype = dtype)
+
+        rows, incidence = sparse["sum"]
+        if len(rows) > 0:
+            results[rows] = incidence.astype(dtype) @ array
+        for function, reduce in [("min", np.minimum), ("max", np.maximum)]:
+            rows, gene_rows, starts = sparse[function]
+            if len(rows) > 0:
+                results[rows] = reduce.reduceat(array[gene_rows], starts, axis = 0)
+        for i,tree in zip(*sparse["nested"]):
+            results[i] = self.evalGPRtreeArray(tree, array, gene_idx)
+        return(results)
+
+    def mapChunk(self, array, gene_idx, compiled, start, stop, engine = "samplewise", sparse = None):
+        '''Maps the columns start:stop of the genes x samples array (see alignData()) with the given engine - this is the task which is send to the workers by mapExpressionToReaction(). It needs only the compiled GPRs (see compileModel() and compileSparse()) and not the cobra.Model itself.'''
+        chunk = array[:,start:stop]
+        if engine == "vectorized":
+            return(self.evalCompiledArray(compiled, chunk, gene_idx))
+        elif engine == "sparse":
+            return(self.evalCompiledSparse(sparse, chunk, gene_idx))
+        else:
+            return(self.evalCompiledSamples(compiled, chunk, gene_idx))
+
+    def __getstate__(self):
+        # the caches are not needed in the worker processes of mapExpressionToReaction(), do not pickle them
+        state = self.__dict__.copy()
+        state["gpr_cache"] = {}
+        state["sparse_cache"] = {}
+        state["align_cache"] = {}
+        return(state)
+
     def mapRxn(self, rxn, expression, protein =False, orIsSum = True):
         '''same as mapGPR only takes reaction object from a cobra.Model to map the expression values'''
         # check whether protein or gene reaction rule should be evaluated
@@ -199,14 +583,17 @@ class omicsMapper:
             gpr = rxn.gene_name_reaction_rule
         else:
             gpr = rxn.gene_reaction_rule
-        val,n = self.mapGPR(gpr = gpr, expression = expression, orIsSum= orIsSum)
+        val = self.evalGPRtree(self.compileGPR(gpr = gpr, orIsSum = orIsSum), expression = expression)
         # return the value
         return(val)
 
-    def mapSampleToModel(self, model, dataframe, column = 0, protein = False, orIsSum = True):
+    def mapSampleToModel(self, model, dataframe, column = 0, protein = False, orIsSum = True, compiled = None):
+        '''maps a single column of the dataframe to the reactions of the model, compiled can be the result of compileModel() to avoid compiling the GPRs again'''
 
+        if compiled is None:
+            compiled = self.compileModel(model, protein = protein, orIsSum = orIsSum)
         dfx = self.parseData(model, dataframe = dataframe, column = column, protein = protein)
-        vals = [self.mapRxn(rxn, expression = dfx, protein= protein, orIsSum= orIsSum) for rxn in model.reactions]
+        vals = [self.evalGPRtree(tree, expression = dfx) for tree in compiled.values()]
         return(vals)
 
     def mapExpressionToReaction(self,
@@ -215,23 +602,34 @@ class omicsMapper:
             column = None,
             protein = False,
             orIsSum = True,
-            num_cores = multiprocessing.cpu_count()-1):
+            num_cores = multiprocessing.cpu_count()-1,
+            engine = "samplewise",
+            backend = "threads",
+            cache = None):
         '''Maps expression values to a reactions of the a cobra.Model object. It takes the expression values as pandas.DataFrame and will map all columns to the model reactions
     Keyword arguments:
         @ model - a cobra.Model object representing the metabolic model
-        @ dataframe - a pandas.DataFrame containing the expression data, the index should correspond to the gene/protein names in the metabolic model
+        @ dataframe - a pandas.DataFrame containing the expression data, the index should correspond to the gene/protein names in the metabolic model - can also be a matrixIO.matrixFile or the path of a ".npy", ".parquet" or ".feather" file written with matrixIO.writeMatrix()
         @ column - a list of indeces for the columns of the dataframe containing the expression data - either as integer corresponding to the column or string of the column name
         @ protein - whether to map the expression to the gene.ids of the model or to the gene-product - basically a switch between model.gene.id (False, default) and model.gene.name (True).
         @ osIsSum - how should the OR operator of the GPR be handled - if True, the pairs of an OR operator are summed, if False, the maximum value of the two is used
-        @ num_cores - how many cores should be used - defaults to all available cores -1
+        @ num_cores - how many cores should be used - defaults to all available cores -1, negative values are interpreted as in joblib (-1 = all cores)
+        @ engine - one of "samplewise", "vectorized" or "sparse". "samplewise" (default) evaluates the GPRs sample by sample, "vectorized" evaluates the GPRs for all samples at once with numpy (see mapArrayToModel()), which is much faster for many samples. Both give the same result. "sparse" uses sparse matrix operations for all non-nested GPRs (see mapSparseToModel()) and is the fastest for large data sets.
+        @ backend - one of "threads" (default), "processes" or "serial". The samples are split into contiguous chunks, one per core, which are mapped in threads or in separate (loky) processes. With "processes" the workers get only the compiled GPRs instead of the model and the expression matrix is shared as a memory map instead of being copied to each worker. "serial" maps everything in the current process.
+        @ cache - a rasCache object or a path to a directory for a rasCache - if given, samples which were mapped before with the same GPRs, expression values and options are taken from the cache and only new samples are mapped.
     Value:
         A pandas.DataFrame containing reactions in rows and samples as columns containing the rxn activity as expression value.
     Note: The GPR is evaluated from left to right, meaning if no parenthesis is set, the operators are evaluated in the order of appearance. This means that: "gene1 and gene2 or gene3" == "(gene1 and gene2) or gene3" != "gene1 and (gene2 or gene3)".
         '''
         
 
-        # get all reactions of the model
-        rxns = [x.id for x in model.reactions]
+        if engine not in ["samplewise", "vectorized", "sparse"]:
+            raise ValueError("engine must be one of: 'samplewise', 'vectorized', 'sparse'")
+        if backend not in ["threads", "processes", "serial"]:
+            raise ValueError("backend must be one of: 'threads', 'processes', 'serial'")
+
+        # open matrix files lazily - ".npy" files stay memory maps
+        dataframe = asFrame(dataframe)
 
         # sanity check for the columns
         if column == None:
@@ -244,27 +642,297 @@ class omicsMapper:
         if any([x not in dataframe.columns for x in column if type(x) == str]):
             raise ValueError("Subscript out of bounds - found index in columns, which does not match any of the columns in the expression dataframe")
 
-        # remove some memory footprint by reducing the expression data to only the relevant genes
-        if protein:
-            genes = [gene.name for gene in model.genes]
+        # get the sample names
+        colnames = [x if type(x) == str else dataframe.columns[x] for x in column]
+
+        # parse the GPRs only once for all samples
+        compiled = self.compileModel(model, protein = protein, orIsSum = orIsSum)
+        if engine == "sparse":
+            sparse = self.compileSparse(model, protein = protein, orIsSum = orIsSum, compiled = compiled)
         else:
-            genes = [gene.id for gene in model.genes]
+            sparse = None
 
-        dataframe= dataframe.loc[[x for x in dataframe.index if x in genes]]
+        # reduce the expression data to the genes x samples matrix of the model genes - use the positions, integer sample names (e.g. of numpy sources in mapExpressionStream()) are not positions in the data frame
+        positions = [dataframe.columns.get_loc(x) if type(x) == str else int(x) for x in column]
+        array, gene_idx = self.alignData(model, dataframe, column = positions, protein = protein)
 
-        # get the sample names and create an empty dataframe
-        colnames = [x if type(x) == str else dataframe.columns[x] for x in column]
-        rxn_exp = pd.DataFrame(np.zeros((len(rxns),len(colnames))), index = rxns, columns = colnames,dtype = float)
-
-        # iterate through the samples and get the relevant expression values - prefer "threads" is speeding up the process enormously
-        results = joblib.Parallel(n_jobs = num_cores, verbose = 10, prefer ="threads")(joblib.delayed(self.mapSampleToModel)(model = model,
-            dataframe = dataframe,
-            column = sample,
-            protein = protein,
-            orIsSum = orIsSum) for sample in colnames)
-        
-        
-        results = pd.DataFrame(np.array(results).transpose(),
+        # take the samples which were mapped before from the cache and map only the others
+        if cache is not None:
+            if type(cache) == str:
+                cache = rasCache(cache)
+            keys = cache.sampleKeys(array, compiled, gene_idx, options = (protein, orIsSum, engine))
+            cached = [cache.get(key) for key in keys]
+            missing = [j for j,x in enumerate(cached) if x is None]
+            print("# Found {n} of {total} samples in the cache".format(n = str(len(keys)-len(missing)), total = str(len(keys))))
+            array = array[:,missing]
+
+        # split the samples in contiguous chunks - one for each core, negative numbers count back from all cores as in joblib (-1 = all cores)
+        n_jobs = joblib.effective_n_jobs(num_cores) if num_cores != 0 else 1
+        bounds = np.linspace(0, array.shape[1], min(n_jobs, max(1, array.shape[1]))+1).astype(int)
+        chunks = list(zip(bounds[:-1], bounds[1:]))
+
+        if array.shape[1] == 0:
+            results = [np.zeros((len(compiled), 0))]
+        elif backend == "serial":
+            results = [self.mapChunk(array, gene_idx, compiled, start, stop, engine = engine, sparse = sparse) for start,stop in chunks]
+        else:
+            if backend == "threads":
+                parallel = joblib.Parallel(n_jobs = n_jobs, verbose = 10, prefer ="threads")
+            else:
+                # arrays larger than max_nbytes are dumped once into a memory map which is opened read only by the workers
+                parallel = joblib.Parallel(n_jobs = n_jobs, verbose = 10, backend = "loky", max_nbytes = "1M", mmap_mode = "r")
+            results = parallel(joblib.delayed(self.mapChunk)(array,
+                gene_idx,
+                compiled,
+                start,
+                stop,
+                engine = engine,
+                sparse = sparse) for start,stop in chunks)
+        results = np.hstack(results)
+
+        if cache is not None:
+            for j,values in zip(missing, results.transpose()):
+                cache.put(keys[j], values)
+                cached[j] = values
+            cache.evict()
+            if len(cached) > 0:
+                results = np.array(cached).transpose()
+            else:
+                results = results.reshape((len(compiled), 0))
+
+        results = pd.DataFrame(results,
                 index = [rxn.id for rxn in model.reactions],
                 columns = colnames)
         return(results)
+
+    def mapExpressionStream(self,
+            model,
+            source,
+            sink,
+            chunk_size = 500,
+            protein = False,
+            orIsSum = True,
+            num_cores = multiprocessing.cpu_count()-1,
+            engine = "sparse",
+            backend = "serial",
+            index = None,
+            columns = None,
+            key = None):
+        '''Maps expression values to the reactions of a cobra.Model chunk by chunk - only chunk_size samples are read, mapped and written at once, so the memory needed is bounded by the chunk size and not by the number of samples.
+    Keyword arguments:
+        @ model - a cobra.Model object representing the metabolic model
+        @ source - the expression data with genes in rows and samples in columns, see readColumnChunks() for the supported formats
+        @ sink - where to write the results - either a function which is called with the pandas.DataFrame (reactions x samples) of each chunk or a path to a ".npy" file. The ".npy" file is written as memory map and the reaction ids and sample names are stored in the sidecar file "<sink>.json", so that the file can be used as source again.
+        @ chunk_size - number of samples per chunk
+        @ protein, orIsSum, num_cores, engine, backend - see mapExpressionToReaction()
+        @ index, columns, key - see readColumnChunks()
+    Value:
+        None - the results are written to the sink
+        '''
+        if type(sink) == str:
+            if not sink.endswith(".npy"):
+                raise ValueError("sink must be a function or a path to a '.npy' file")
+            header = self.sourceColumns(source, columns = columns, key = key)
+            rxns = [rxn.id for rxn in model.reactions]
+            out = None
+            writeSidecar(sink, rxns, header)
+        elif not callable(sink):
+            raise ValueError("sink must be a function or a path to a '.npy' file")
+
+        start = 0
+        for chunk in self.readColumnChunks(source, chunk_size = chunk_size, index = index, columns = columns, key = key):
+            results = self.mapExpressionToReaction(model,
+                    dataframe = chunk,
+                    column = list(range(chunk.shape[1])),
+                    protein = protein,
+                    orIsSum = orIsSum,
+                    num_cores = num_cores,
+                    engine = engine,
+                    backend = backend)
+            if type(sink) == str:
+                # the memory map is created with the first chunk as the data type is not known before
+                if out is None:
+                    out = np.lib.format.open_memmap(sink, mode = "w+", dtype = results.values.dtype, shape = (len(rxns), len(header)))
+                out[:,start:start+results.shape[1]] = results.values
+                out.flush()
+            else:
+                sink(results)
+            start = start + results.shape[1]
+            print("# Mapped {n} samples".format(n = str(start)))
+
+        if type(sink) == str:
+            # write an empty file if there was no sample at all
+            if out is None:
+                out = np.lib.format.open_memmap(sink, mode = "w+", dtype = float, shape = (len(rxns), 0))
+            del out
+
+    def sourceColumns(self, source, columns = None, key = None):
+        ''' returns the column names of a source of readColumnChunks() without reading the data'''
+        if isinstance(source, pd.DataFrame):
+            return(list(source.columns))
+        elif isinstance(source, matrixFile):
+            if columns is None:
+                columns = source.columns
+            return(list(columns))
+        elif isinstance(source, np.ndarray):
+            if columns is None:
+                columns = list(range(source.shape[1]))
+            return(list(columns))
+        elif type(source) == str:
+            name = source.lower().replace(".gz", "")
+            if name.endswith(".npy"):
+                if columns is None:
+                    columns = readSidecar(source).get("columns")
+                if columns is None:
+                    columns = list(range(np.load(source, mmap_mode = "r").shape[1]))
+                return(list(columns))
+            elif name.endswith((".csv", ".tsv", ".txt")):
+                sep = "\t" if name.endswith(".tsv") else ","
+                return(list(pd.read_csv(source, index_col = 0, nrows = 0, sep = sep).columns))
+            elif fileFormat(name) in ["parquet", "feather"]:
+                # get the column names from the sidecar or the schema without reading the data
+                return(self.sourceColumns(matrixFile(source), columns = columns))
+            elif name.endswith((".h5", ".hdf5", ".hdf")):
+                return(list(pd.read_hdf(source, key = key, stop = 0).columns))
+            else:
+                raise ValueError("Unknown file type of {source} - use csv, parquet, feather, HDF5 or npy files".format(source = source))
+        else:
+            raise ValueError("source must be a pandas.DataFrame, a numpy.array, a matrixFile or a path to a file")
+
+    def readColumnChunks(self, source, chunk_size = 500, index = None, columns = None, key = None):
+        '''Reads an expression matrix in chunks of columns, so that only chunk_size samples are held in memory at once.
+    Keyword arguments:
+        @ source - either a pandas.DataFrame, a numpy.array/numpy.memmap, a matrixIO.matrixFile or a path to a file. Files can be csv (".csv", ".tsv", ".txt", optionally gzipped, first column is the index, the text is parsed only once into a temporary memory map, see textToArray()), parquet (".parquet", needs pyarrow, the names are taken from the sidecar file "<source>.json" if there is one), feather (".feather", see matrixIO.writeMatrix()), HDF5 (".h5", ".hdf5", ".hdf" - written with format = "table", needs pytables) or numpy (".npy", opened as memory map).
+        @ chunk_size - number of columns per chunk
+        @ index - the row names for numpy sources - for ".npy" files the row names are read from the sidecar file "<source>.json" if not given (see mapExpressionStream())
+        @ columns - the column names for numpy sources, defaults to the sidecar file or the column numbers
+        @ key - the key of the table in HDF5 files
+    Value:
+        A generator of pandas.DataFrames with chunk_size columns each.
+        '''
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer")
+
+        header = self.sourceColumns(source, columns = columns, key = key)
+        tmp = None
+        if type(source) == str and source.lower().replace(".gz", "").endswith((".csv", ".tsv", ".txt")):
+            # parse the text only once into a temporary memory map and read the chunks from there
+            source, index, tmp = self.textToArray(source, len(header))
+        if type(source) == str and fileFormat(source) in ["parquet", "feather"]:
+            source = matrixFile(source)
+        if isinstance(source, matrixFile) and index is None:
+            index = source.index
+        if type(source) == str and source.endswith(".npy"):
+            if index is None:
+                index = readSidecar(source).get("index")
+            source = np.load(source, mmap_mode = "r")
+        if isinstance(source, np.ndarray) and index is None:
+            raise ValueError("index must be given for numpy sources")
+
+        try:
+            for start in range(0, len(header), chunk_size):
+                stop = min(start+chunk_size, len(header))
+                if isinstance(source, pd.DataFrame):
+                    yield(source.iloc[:,start:stop])
+                elif isinstance(source, matrixFile):
+                    # read only the columns of the chunk
+                    yield(pd.DataFrame(source.array(columns = list(range(start, stop))), index = index, columns = header[start:stop]))
+                elif isinstance(source, np.ndarray):
+                    # copy only the current chunk into memory
+                    yield(pd.DataFrame(np.array(source[:,start:stop]), index = index, columns = header[start:stop]))
+                else:
+                    yield(pd.read_hdf(source, key = key, columns = header[start:stop]))
+        finally:
+            if tmp is not None:
+                del source
+                os.remove(tmp)
+
+    def textToArray(self, source, n_columns, block_elements = 2**24):
+        '''Parses a csv/tsv file (see readColumnChunks()) once in blocks of rows and writes the values into a temporary memory map (float64), so that column chunks can be read without parsing the text again. Only one block of about block_elements values is held in memory at once.
+    Value:
+        The numpy.memmap (genes x samples), the row names and the path of the temporary file, which has to be removed by the caller.
+        '''
+        sep = "\t" if source.lower().replace(".gz", "").endswith(".tsv") else ","
+        handle, tmp = tempfile.mkstemp(suffix = ".bin", prefix = "corpse_")
+        index = []
+        try:
+            with os.fdopen(handle, "wb") as fh:
+                for block in pd.read_csv(source, index_col = 0, sep = sep, chunksize = max(1, block_elements // max(1, n_columns))):
+                    fh.write(np.ascontiguousarray(block.values, dtype = "float64").tobytes())
+                    index.extend(block.index)
+            if len(index) == 0:
+                return(np.zeros((0, n_columns)), index, tmp)
+            return(np.memmap(tmp, dtype = "float64", mode = "r", shape = (len(index), n_columns)), index, tmp)
+        except:
+            os.remove(tmp)
+            raise
+
+
+class rasCache:
+    '''A persistent cache for the results of omicsMapper.mapExpressionToReaction() - each sample is stored as a single ".npy" file in the cache directory, named by a hash of the GPRs of the model, the mapping options and the expression values of the model genes in the sample. The sample names are not part of the hash, thus samples which were already mapped are found even if the data set was extended by new samples or the samples were renamed. If the cache grows larger than max_size bytes, the least recently used samples are removed.'''
+    def __init__(self, path, max_size = 2**30):
+        self.name = "rasCache"
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok = True)
+
+    def modelKey(self, compiled, gene_idx, options):
+        ''' returns a hash of the compiled GPRs (see omicsMapper.compileModel()), the gene order of the expression array and the mapping options'''
+        sha = hashlib.sha1()
+        sha.update(repr((list(compiled.items()), list(gene_idx), options)).encode())
+        return(sha.hexdigest())
+
+    def sampleKeys(self, array, compiled, gene_idx, options):
+        '''returns the keys of each sample (column) in the genes x samples array (see omicsMapper.alignData())
+    Keyword arguments:
+        @ array - the expression values of the model genes
+        @ compiled - the compiled GPRs of the model, see omicsMapper.compileModel()
+        @ gene_idx - a dictionary with gene:row pairs for the array
+        @ options - a tuple of all other options which change the result of the mapping
+        '''
+        model_key = self.modelKey(compiled, gene_idx, options).encode()
+        keys = []
+        for j in range(array.shape[1]):
+            sha = hashlib.sha1(model_key)
+            sha.update(str(array.dtype).encode())
+            sha.update(np.ascontiguousarray(array[:,j]).tobytes())
+            keys.append(sha.hexdigest())
+        return(keys)
+
+    def file(self, key):
+        ''' returns the path of the file for the key - the files are distributed in sub directories by the first two characters of the key'''
+        return(os.path.join(self.path, key[:2], key + ".npy"))
+
+    def get(self, key):
+        ''' returns the reaction activities stored for the key or None if the key is not in the cache'''
+        path = self.file(key)
+        try:
+            values = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return(None)
+        # mark the file as recently used
+        os.utime(path)
+        return(values)
+
+    def put(self, key, values):
+        ''' stores the reaction activities for the key'''
+        path = self.file(key)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with atomicWrite(path) as tmp:
+            with open(tmp, "wb") as fh:
+                np.save(fh, values)
+
+    def evict(self):
+        ''' removes the least recently used files until the cache is smaller than max_size'''
+        files = []
+        for root, dirs, names in os.walk(self.path):
+            for name in names:
+                if name.endswith(".npy"):
+                    stat = os.stat(os.path.join(root, name))
+                    files.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        size = sum(x[1] for x in files)
+        for mtime, nbytes, path in sorted(files):
+            if size <= self.max_size:
+                break
+            os.remove(path)
+            size = size - nbytes
@@ -5,48 +5,407 @@
 
 import cobra as cb
 import cobamp as ca
+import pandas as pd
 from troppo.methods.reconstruction.fastcore import FASTcore, FastcoreProperties
 import warnings
 import time
 from contextlib import contextmanager,redirect_stderr,redirect_stdout
 from os import devnull
+import os
+import json
+import hashlib
+import numpy as np
+import scipy.sparse as sps
+from optlang.symbolics import Zero
+from corpse.coreSetFinder import packedCoreSet
+from corpse.matrixIO import asFrame, atomicWrite
+from corpse.workerPool import iterTasks
+
+
+@contextmanager
+def suppress_output():
+    """A context manager that redirects stdout and stderr to devnull"""
+    with open(devnull, 'w') as fnull:
+        with redirect_stderr(fnull) as err, redirect_stdout(fnull) as out:
+            yield (err, out)
+
+
+class troppoFastcore():
+    ''' Runs troppos FASTcore implementation on a fixed stoichiometric matrix and bounds - the arrays are converted only once and can be used for any number of core sets. The stoichiometric matrix is kept sparse, but troppo needs a dense copy for every core set, thus the memory peak of each run is that of the dense matrix (see nativeFastcore for an engine without dense copy).
+    @ S - the stoichiometric matrix, dense or scipy.sparse
+    @ lb, ub - lists of the lower and upper bounds of the reactions
+    @ solver - the name of the solver, e.g. "GLPK" or "CPLEX"
+    @ zero_cutoff - the flux threshold of fastcore'''
+    def __init__(self, S, lb, ub, solver, zero_cutoff):
+        self.S = sps.csr_matrix(S)
+        self.lb = np.asarray(lb)
+        self.ub = np.asarray(ub)
+        self.solver = solver
+        self.zero_cutoff = zero_cutoff
+
+    def fastcore(self, core_idx):
+        ''' Runs fastcore for the core reactions core_idx (list of indices in S) and returns the indices of the reactions in the context specific model'''
+        with suppress_output(): # remove the noise from the troppo fastcore implementation
+            fastcoresolver = FASTcore(self.S.toarray(), self.lb, self.ub, # this is everything which is needed from the model
+                    FastcoreProperties(core= list(core_idx),
+                        solver = self.solver,
+                        flux_threshold = self.zero_cutoff)
+                    )
 
+            # run fastcore
+            specific_idx = fastcoresolver.fastcore()
+        return(specific_idx)
+
+
+class nativeFastcore():
+    ''' A fastcore implementation which works directly on the optlang interface of the solver. The variables of the fluxes and the mass balance constraints are created only once and used for all LP7 and LP9 problems of any number of core sets - only the auxiliary variables and constraints of each problem are added and removed, no dense matrix is created. The problems, the solver settings and the steps of the algorithm are the same as in troppos FASTcore (including the scaling of LP9 and the conditions to flip reactions and to switch to single reactions), thus both give the same reactions.
+    @ S - the stoichiometric matrix, dense or scipy.sparse
+    @ lb, ub - lists of the lower and upper bounds of the reactions
+    @ solver - the name of the solver, e.g. "GLPK" or "CPLEX"
+    @ zero_cutoff - the flux threshold of fastcore'''
+    # scaling factor of the bounds in LP9, see troppo
+    scaling = 1e5
+
+    def __init__(self, S, lb, ub, solver, zero_cutoff):
+        self.S = sps.csc_matrix(S)
+        self.model_lb = np.array(lb, dtype = float)
+        self.model_ub = np.array(ub, dtype = float)
+        self.solver = solver
+        self.zero_cutoff = zero_cutoff
+        self.n_metabolites, self.n_reactions = self.S.shape
+        self.create_problem()
+
+    def create_problem(self):
+        ''' Creates the linear problem with the fluxes and the mass balance constraints'''
+        self.interface = cb.util.solver.solvers[self.solver.lower()]
+        self.problem = self.interface.Model()
+        # same settings as in cobamp, which is used by troppo - not all of them are available for every solver
+        configuration = self.problem.configuration
+        try:
+            configuration.tolerances.feasibility = 1e-9
+            configuration.tolerances.optimality = 1e-9
+            configuration.tolerances.integrality = 1e-9
+            configuration.lpmethod = "auto"
+            configuration.presolve = True
+        except Exception:
+            pass
+        self.presolve = configuration.presolve
+        self.v = [self.interface.Variable("V" + str(j), lb = self.model_lb[j], ub = self.model_ub[j]) for j in range(self.n_reactions)]
+        self.problem.add(self.v)
+        self.mass_balance = [self.interface.Constraint(Zero, lb = 0, ub = 0) for i in range(self.n_metabolites)]
+        self.problem.add(self.mass_balance, sloppy = True)
+        self.problem.update()
+        self.sign = np.ones(self.n_reactions)
+        self.lb = self.model_lb.copy()
+        self.ub = self.model_ub.copy()
+        self.scale = 1
+        self.set_stoichiometry()
+
+    def set_stoichiometry(self):
+        ''' Writes the mass balance constraints with the current directions of the reactions'''
+        S = sps.csr_matrix(self.S.multiply(self.sign[None,:]))
+        if self.solver.lower() == "glpk":
+            # glpk solutions depend on the order of the matrix elements, all rows are written in order like in a new problem
+            import swiglpk
+            for i,constraint in enumerate(self.mass_balance):
+                start, end = S.indptr[i], S.indptr[i+1]
+                ia = swiglpk.intArray(int(end - start) + 1)
+                va = swiglpk.doubleArray(int(end - start) + 1)
+                for k,(j,coef) in enumerate(zip(S.indices[start:end], S.data[start:end])):
+                    ia[k+1] = self.v[j]._index
+                    va[k+1] = float(coef)
+                swiglpk.glp_set_mat_row(self.problem.problem, constraint._index, int(end - start), ia, va)
+        else:
+            for i,constraint in enumerate(self.mass_balance):
+                start, end = S.indptr[i], S.indptr[i+1]
+                if end > start:
+                    constraint.set_linear_coefficients({self.v[j] : coef for j,coef in zip(S.indices[start:end], S.data[start:end])})
+        self.problem.update()
+        self.flipped = False
+
+    def solve(self, variables, rows, objective, presolve):
+        ''' Adds the auxiliary variables and constraints, minimizes the objective and returns the fluxes - afterwards the auxiliary variables and constraints are removed again
+        @ variables - list of (lb, ub) of the auxiliary variables
+        @ rows - list of (coefficients, lb, ub) of the auxiliary constraints, coefficients is a dictionary of variable index:coefficient, the auxiliary variables follow the fluxes
+        @ objective - dictionary of variable index:coefficient
+        @ presolve - the presolve setting of the solver
+        Errors of the solver are raised, solutions which are not optimal are used with a warning (like in troppo).'''
+        if self.flipped:
+            self.set_stoichiometry()
+        aux = [self.interface.Variable("V" + str(self.n_reactions + i), lb = lb, ub = ub) for i,(lb,ub) in enumerate(variables)]
+        self.problem.add(aux)
+        self.problem.update()
+        variables = self.v + aux
+        constraints = [self.interface.Constraint(Zero, lb = lb, ub = ub) for coefficients,lb,ub in rows]
+        self.problem.add(constraints, sloppy = True)
+        self.problem.update()
+        for constraint,(coefficients,lb,ub) in zip(constraints, rows):
+            constraint.set_linear_coefficients({variables[j] : coef for j,coef in coefficients.items()})
+        self.problem.objective = self.interface.Objective(Zero, direction = "min")
+        self.problem.objective.set_linear_coefficients({variables[j] : coef for j,coef in objective.items()})
+        self.problem.configuration.presolve = presolve
+        self.problem.update()
+        if self.solver.lower() == "glpk":
+            # glpk keeps the basis of the last problem, which is invalid after removing the auxiliary variables - start from the standard basis like a new problem in troppo
+            import swiglpk
+            swiglpk.glp_std_basis(self.problem.problem)
+        try:
+            status = self.problem.optimize()
+            if status != "optimal":
+                # troppo uses these solutions as well (its LP9 is often reported infeasible by GLPK), thus only warn to get the same reactions
+                warnings.warn("The linear problem of fastcore is {status} - the fluxes of the last solution are used".format(status = status))
+            V = np.array(self.problem._get_primal_values()[:self.n_reactions])
+            if np.isnan(V).any():
+                raise RuntimeError("The solver returned no fluxes for the linear problem of fastcore ({status})".format(status = status))
+        finally:
+            # leave the problem clean for the next core set, also if the solver failed
+            self.problem.remove(constraints + aux)
+            self.problem.update()
+        return(V)
+
+    def flip(self, idx):
+        ''' Reverses the direction of the reactions idx - the bounds are swapped and the columns of the stoichiometric matrix are multiplied by -1 before the next LP'''
+        for j in idx:
+            self.sign[j] = -self.sign[j]
+            self.lb[j], self.ub[j] = -self.ub[j], -self.lb[j]
+            self.v[j].set_bounds(self.lb[j]*self.scale, self.ub[j]*self.scale)
+            self.flipped = True
+
+    def reset(self):
+        ''' Restores the original direction of all reactions'''
+        self.flip(np.where(self.sign < 0)[0])
+        self.set_scale(1)
+
+    def set_scale(self, scale):
+        ''' Scales the bounds of the fluxes'''
+        if scale != self.scale:
+            self.scale = scale
+            for j in range(self.n_reactions):
+                self.v[j].set_bounds(self.lb[j]*scale, self.ub[j]*scale)
+
+    def LP7(self, J):
+        ''' Maximizes the number of reactions in J carrying at least the flux threshold and returns the fluxes'''
+        self.set_scale(1)
+        nJ = len(J)
+        n = self.n_reactions
+        variables = [(-np.inf, self.zero_cutoff)]*nJ
+        rows = [({j : -1.0, n+i : 1.0}, None, 0) for i,j in enumerate(J)]
+        return(self.solve(variables, rows, {n+i : -1.0 for i in range(nJ)}, presolve = False))
+
+    def LP9(self, K, P):
+        ''' Minimizes the sum of absolute fluxes of the reactions in P, while all reactions in K carry at least the flux threshold, and returns the scaled fluxes'''
+        self.set_scale(self.scaling)
+        nP = len(P)
+        n = self.n_reactions
+        bounds = np.maximum(np.abs(self.model_lb[P]), np.abs(self.model_ub[P]))*self.scaling
+        variables = [(0, bound) for bound in bounds]
+        rows = [({p : 1.0, n+i : -1.0}, None, 0) for i,p in enumerate(P)]
+        rows = rows + [({p : -1.0, n+i : -1.0}, None, 0) for i,p in enumerate(P)]
+        rows = rows + [({k : -1.0}, None, -self.zero_cutoff*self.scaling) for k in K]
+        return(self.solve(variables, rows, {n+i : 1.0 for i in range(nP)}, presolve = self.presolve))
+
+    def find_sparse_mode(self, J, P, singleton):
+        ''' Returns the reactions in the support of a sparse flux mode carrying flux through as many reactions of J as possible'''
+        if J.size == 0:
+            return(np.array([], dtype = int))
+        if singleton:
+            V = self.LP7(J[:1])
+        else:
+            V = self.LP7(J)
+        # like in troppo all reactions of J are checked, also in the singleton case
+        K = np.array([j for j in J if V[j] >= 0.99*self.zero_cutoff])
+        if K.size > 0:
+            if P.size == 0:
+                raise Exception("No non core reactions left for LP9")
+            V = self.LP9(K, P)
+            return(np.where(np.abs(V) >= 0.99*self.zero_cutoff)[0])
+        return(np.array([]))
+
+    def fastcore(self, core_idx):
+        ''' Runs fastcore for the core reactions core_idx (list of indices in S) and returns the indices of the reactions in the context specific model'''
+        self.reset()
+        core = np.array(list(core_idx))
+        self.flip(np.where(self.model_ub <= 0)[0])
+        irreversible = np.where(self.model_lb >= 0)[0]
+        J = np.intersect1d(core, irreversible)
+        P = np.setdiff1d(np.arange(self.n_reactions), core)
+        supp = self.find_sparse_mode(J, P, False)
+        if np.setdiff1d(J, supp).size > 0:
+            raise Exception('Inconsistent irreversible core reactions \n\tImpossible to build model')
+        J = np.setdiff1d(core, supp)
+        A = supp
+
+        flipped = False
+        singleton = False
+        while J.size > 0:
+            P = np.setdiff1d(P, A)
+            supp = self.find_sparse_mode(J, P, singleton)
+            A = np.union1d(A, supp).astype(int)
+            # troppo compares the intersection to an empty array, which is only True for more than one element
+            if np.intersect1d(J, A).size > 1:
+                J = np.setdiff1d(J, A)
+                flipped = False
+            else:
+                if singleton:
+                    JiRev = np.setdiff1d(J[0], irreversible)
+                else:
+                    JiRev = np.setdiff1d(J, irreversible)
+                # troppo also compares JiRev to an empty array, which is never True - an empty JiRev is "flipped" as well
+                if flipped:
+                    if singleton:
+                        return(sorted(np.union1d(A, J)))
+                    else:
+                        flipped = False
+                        singleton = True
+                else:
+                    self.flip(JiRev)
+                    flipped = True
+        return(sorted(A))
+
+
+# the available fastcore implementations, see simpleFastcore(engine = ...)
+fastcore_engines = {"troppo" : troppoFastcore,
+        "native" : nativeFastcore}
 
-class simpleFastcore():
-    ''' This class is an attempt to simplify the usage of fastcore - simply supply the model which should be used and a set of core reactions as a list of reaction IDs and call self.run() - and get the ready to use core model. All steps in between can be executed individually as well, see self.FVA_consistency(), self.fastcc(), self.fastcc_repeat() and self.fastcore(). Note: these are all just wrappers for functions implemented in cobrapy, cobamp and troppo'''
-    def __init__(self, model, core_set = [],  max_boundaries = 1000, zero_cutoff = None):
 
-        self.model = model.copy()
-        self.model_ori = model.copy()
-        self.status = []
-        self.solver = None
+class simpleFastcore():
+    ''' This class is an attempt to simplify the usage of fastcore - simply supply the model which should be used and a set of core reactions as a list of reaction IDs and call self.run() - and get the ready to use core model. All steps in between can be executed individually as well, see self.FVA_consistency(), self.fastcc(), self.fastcc_repeat() and self.fastcore(). Note: these are all just wrappers for functions implemented in cobrapy, cobamp and troppo
+    If fast_consistency is True, FVA_consistency() uses find_blocked_fast() instead of the FVA of cobrapy to find the blocked reactions.
+    engine selects the fastcore implementation (see fastcore_engines): "troppo" (default) uses troppos FASTcore, "native" uses nativeFastcore, which gives the same reactions but keeps a single linear problem in the solver.
+    The model is copied only once (self.model_ori). All steps work on the sparse stoichiometric matrix and arrays of the bounds, the reactions of the current state are marked in self.active. Linear problems are solved on self.model_ori with the bounds of all inactive reactions set to 0 (see active_model()), and the cobra model of the current state (self.model) is created only when it is requested - changed bounds and removed reactions of self.model are taken over, a model assigned to self.model replaces the original model.
+    The reactions removed by FVA_consistency() and fastcc() are cached for all simpleFastcore objects in the running python session, so that the consistent model is created only once for the same model, bounds, solver and zero_cutoff. If consistency_cache is a path to a directory, the removed reactions are additionally stored on disk and can be reused by other processes.'''
+    # removed reactions of the consistency algorithms, shared between all instances - see consistency_key()
+    consistency_cache = {}
+
+    def __init__(self, model, core_set = [],  max_boundaries = 1000, zero_cutoff = None, consistency_cache = None, fast_consistency = False, engine = "troppo"):
+
+        if engine not in fastcore_engines:
+            raise ValueError("engine must be one of: " + ", ".join(["'" + x + "'" for x in fastcore_engines]))
+        self.engine = engine
         self.max_boundaries = max_boundaries
+        self.consistency_path = consistency_cache
+        self.fast_consistency = fast_consistency
+        if self.consistency_path is not None:
+            os.makedirs(self.consistency_path, exist_ok = True)
+        self.load_model(model)
         if zero_cutoff == None:
-            self.zero_cutoff = self.model.tolerance
+            self.zero_cutoff = self.model_ori.tolerance
         else:
             self.zero_cutoff = zero_cutoff
 
-        
         self.set_core_set(core_set = core_set)
         self.core_set_ori = core_set
+
+    def load_model(self, model):
+        ''' Copies the model and initializes the state for it - all previous steps are discarded'''
+        self.model_ori = model.copy()
+        self.rxn_ids = np.array([x.id for x in self.model_ori.reactions], dtype = object)
+        self.rxn_pos = {x : i for i,x in enumerate(self.rxn_ids)}
+        self.active = np.ones(len(self.rxn_ids), dtype = bool)
+        self.met_active = np.ones(len(self.model_ori.metabolites), dtype = bool)
+        self.S = None
+        self.current_model = None
+        self.bounds_ori = {} # bounds of the reactions changed by sync_model(), restored by reset_model()
+        self.status = []
+        self.solver = None
         self.check_solver()
         self.check_boundaries()
         self.fastcc_runs = 0
-        
 
     @contextmanager
     def suppress_stdout_stderr(self):
         """A context manager that redirects stdout and stderr to devnull"""
         # this is just needed to catch the chatter of the troppo functions
-        with open(devnull, 'w') as fnull:
-            with redirect_stderr(fnull) as err, redirect_stdout(fnull) as out:
-                yield (err, out)
-        
+        with suppress_output() as (err, out):
+            yield (err, out)
+
+    @property
+    def model(self):
+        ''' The cobra model of the current state - it is created from the original model only when it is requested and reused until the reactions change. Changed bounds and removed reactions of this model are taken over by the next step (see sync_model()), assigning a new model starts from scratch with it (see load_model()).'''
+        if self.current_model is None:
+            self.current_model = self.build_model(np.where(self.active)[0])
+        return(self.current_model)
+
+    @model.setter
+    def model(self, model):
+        self.load_model(model)
+        self.set_core_set(self.core_set_ori)
+
+    def sync_model(self):
+        ''' Takes over the changes of self.model into the state - changed bounds are set in the original model and removed reactions are deactivated. Added reactions or changed stoichiometries can not be taken over and raise a ValueError, assign the changed model to self.model instead. Returns True if something was changed.'''
+        model = self.current_model
+        if model is None:
+            return(False)
+        ids = [x.id for x in model.reactions]
+        active = set(self.rxn_ids[self.active])
+        added = [x for x in ids if x not in active]
+        if len(added) > 0:
+            raise ValueError("Reactions were added to self.model ({rxns}) - assign the changed model to self.model instead".format(rxns = ", ".join(added[:5])))
+        changed = False
+        inf = float("inf")
+        for rxn in model.reactions:
+            i = self.rxn_pos[rxn.id]
+            ori = self.model_ori.reactions[i]
+            if {x.id : c for x,c in rxn.metabolites.items()} != {x.id : c for x,c in ori.metabolites.items()}:
+                raise ValueError("The stoichiometry of {rxn} was changed in self.model - assign the changed model to self.model instead".format(rxn = rxn.id))
+            if rxn.bounds != ori.bounds:
+                self.bounds_ori.setdefault(i, ori.bounds)
+                # same limits as in check_boundaries()
+                ori.bounds = tuple([max(-self.max_boundaries, min(self.max_boundaries, x)) if abs(x) == inf else x for x in rxn.bounds])
+                self.lb[i], self.ub[i] = ori.bounds
+                changed = True
+        removed = active.difference(ids)
+        if len(removed) > 0:
+            # the metabolites were already removed from self.model
+            self.deactivate(removed, remove_orphans = True)
+            changed = True
+        return(changed)
+
+    def build_model(self, keep_idx):
+        ''' Returns a copy of the original model which contains only the reactions with the indices keep_idx and the metabolites of the current model'''
+        model = self.model_ori.copy()
+        keep = np.zeros(len(self.rxn_ids), dtype = bool)
+        keep[keep_idx] = True
+        model.remove_reactions([x for x,k in zip(model.reactions, keep) if not k])
+        model.remove_metabolites([x for x,k in zip(model.metabolites, self.met_active) if not k])
+        return(model)
+
+    @contextmanager
+    def active_model(self):
+        ''' A context manager which yields the original model with the bounds of all inactive reactions set to 0 - the model is equivalent to the current model for all linear problems, but needs no copy'''
+        self.sync_model()
+        with self.model_ori as model:
+            for i in np.where(~self.active)[0]:
+                model.reactions[i].bounds = (0, 0)
+            yield model
+
+    def active_ids(self):
+        ''' Returns the IDs of the reactions in the current model'''
+        self.sync_model()
+        return(list(self.rxn_ids[self.active]))
+
+    def deactivate(self, rxn_ids, remove_orphans = False):
+        ''' Removes the reactions with the IDs rxn_ids from the current model
+        @ remove_orphans - if True, the metabolites of the removed reactions which are not part of any other reaction of the current model are removed as well (like cobra.Model.remove_reactions())'''
+        idx = [self.rxn_pos[x] for x in rxn_ids]
+        self.active[idx] = False
+        if remove_orphans and len(idx) > 0:
+            S = self.get_stoichiometry()
+            mets = np.unique(S[:, idx].nonzero()[0])
+            n_active = np.asarray((S.tocsr()[mets, :][:, self.active] != 0).sum(axis = 1)).ravel()
+            self.met_active[mets[n_active == 0]] = False
+        self.current_model = None
+
+    def get_stoichiometry(self):
+        ''' Returns the sparse stoichiometric matrix of the original model - it is created only once'''
+        if self.S is None:
+            self.S = cb.util.create_stoichiometric_matrix(self.model_ori, array_type = "lil").tocsc()
+        return(self.S)
     
     def check_solver(self):
         ''' Gets the solver which is set for the model'''
         if self.solver == None:
-            self.solver = str(self.model.solver.interface.Model).split(".")[1].replace("_interface","").upper()
+            self.solver = str(self.model_ori.solver.interface.Model).split(".")[1].replace("_interface","").upper()
         print("# Will use " + self.solver + " as linear problem solver")
         self.status.append("Solver_checked")
     
@@ -59,7 +418,7 @@ class simpleFastcore():
 
         print("# Will adjust model boundaries which are set to inf/-inf and set it to {boundary}/-{boundary}".format(boundary = str(self.max_boundaries)))
         inf = float("inf")
-        for rxn in self.model.reactions:
+        for rxn in self.model_ori.reactions:
             if rxn.upper_bound == inf:
                 rxn.upper_bound = self.max_boundaries
             elif rxn.upper_bound == -1*inf:
@@ -68,19 +427,27 @@ class simpleFastcore():
                 rxn.lower_bound = self.max_boundaries
             elif rxn.lower_bound == -1*inf:
                 rxn.lower_bound = -1*self.max_boundaries
+        self.lb = np.array([x.lower_bound for x in self.model_ori.reactions])
+        self.ub = np.array([x.upper_bound for x in self.model_ori.reactions])
 
         self.status.append("boundaries_checked")
 
     def check_core_rxns(self):
         ''' Checks if the core set is not empty after extracting the consistent model'''
-        self.core_idx = [i for i,x in enumerate(self.model.reactions) if x.id in self.core_set]
+        core_set = set(self.core_set)
+        self.core_idx = [i for i,x in enumerate(self.active_ids()) if x in core_set]
         if len(self.core_idx) == 0:
             raise ValueError("No core set left in the model provided, check your input!")
     
     def reset_model(self):
         ''' resets the model to the original input model in case one wants to use a different consistency algorithm'''
         # reset the model to the initial state including the checks
-        self.model = self.model_ori.copy()
+        for i, bounds in self.bounds_ori.items():
+            self.model_ori.reactions[i].bounds = bounds
+        self.bounds_ori = {}
+        self.active[:] = True
+        self.met_active[:] = True
+        self.current_model = None
         self.status =[]
         self.check_solver()
         self.check_boundaries()
@@ -93,14 +460,51 @@ class simpleFastcore():
 
         if all([True if type(x) == int else False for x in core_set]):
             self.core_idx = core_set
-            self.core_set = [self.model.reactions[i].id for i in core_set]
+            rxn_ids = self.active_ids()
+            self.core_set = [rxn_ids[i] for i in core_set]
         elif all([True if type(x) == str else False for x in core_set]):
             self.core_set = core_set
-            self.core_idx = [i for i,x in enumerate(self.model.reactions) if x.id in self.core_set]
+            core_set = set(core_set)
+            self.core_idx = [i for i,x in enumerate(self.active_ids()) if x in core_set]
         else:
             raise ValueError("core_set needs to be either index of name_ID of reactions in the model")
         
     
+    def consistency_key(self, method):
+        ''' Returns a hash of the stoichiometry and bounds of the current model, the solver, the zero_cutoff and the consistency method - the key for the consistency cache'''
+        self.sync_model()
+        sha = hashlib.sha1()
+        sha.update(repr((method, self.solver, self.zero_cutoff)).encode())
+        for i in np.where(self.active)[0]:
+            rxn = self.model_ori.reactions[i]
+            sha.update(repr((rxn.id,
+                rxn.lower_bound,
+                rxn.upper_bound,
+                sorted([(met.id, coef) for met,coef in rxn.metabolites.items()]))).encode())
+        return(sha.hexdigest())
+
+    def get_cached_consistency(self, key):
+        ''' Returns the list of reaction IDs removed from the model by the consistency algorithm stored for the key or None if the key is neither in the memory nor in the disk cache'''
+        if key in simpleFastcore.consistency_cache:
+            return(list(simpleFastcore.consistency_cache[key]))
+        if self.consistency_path is not None:
+            path = os.path.join(self.consistency_path, key + ".json")
+            if os.path.exists(path):
+                with open(path) as handle:
+                    removed = json.load(handle)
+                simpleFastcore.consistency_cache[key] = tuple(removed)
+                return(removed)
+        return(None)
+
+    def put_cached_consistency(self, key, removed):
+        ''' Stores the list of reaction IDs removed by the consistency algorithm in the memory and disk cache'''
+        simpleFastcore.consistency_cache[key] = tuple(removed)
+        if self.consistency_path is not None:
+            path = os.path.join(self.consistency_path, key + ".json")
+            with atomicWrite(path) as tmp:
+                with open(tmp, "w") as handle:
+                    json.dump(list(removed), handle)
+
     def fastcc(self):
         ''' Creates a consistent model using the fastcc algorithm '''
 
@@ -110,11 +514,21 @@ class simpleFastcore():
 
         # get the number of reactions to report afterwards
         tictic = time.perf_counter()
-        init_rxn = len(self.model.reactions) 
+        init_rxn = int(self.active.sum())
 
         # reduce the model
-        self.model = cb.flux_analysis.fastcc(model = self.model, zero_cutoff = self.zero_cutoff)
-        cons_rxn = len(self.model.reactions)
+        key = self.consistency_key("fastcc")
+        removed = self.get_cached_consistency(key)
+        if removed is None:
+            with self.active_model() as model:
+                consistent = cb.flux_analysis.fastcc(model = model, zero_cutoff = self.zero_cutoff)
+            kept = set([x.id for x in consistent.reactions])
+            removed = [x for x in self.active_ids() if x not in kept]
+            self.put_cached_consistency(key, removed)
+        else:
+            print("# Found the inconsistent reactions in the consistency cache")
+        self.deactivate(removed, remove_orphans = True)
+        cons_rxn = int(self.active.sum())
         toc = time.perf_counter()
         
         
@@ -130,17 +544,165 @@ class simpleFastcore():
         if "consistent" not in self.status: 
             self.status.append("consistent")
 
-    def FVA_consistency(self):
-        ''' Creates a consistent model using FVA - this is the default as it seems to produce most consistent results'''
+    def find_blocked_fast(self, reaction_list = None, n_random = 10, seed = 0):
+        ''' Returns the IDs of the blocked reactions in the model - gives the same result as cobra.flux_analysis.find_blocked_reactions() with the same zero_cutoff, but needs far less linear problems. First, reactions which can not carry flux because of their bounds or because they are connected to a dead end metabolite are removed iteratively without solving any problem. Afterwards, linear problems with random objectives are solved and every reaction carrying flux in a solution is not blocked. Only for the remaining reactions the minimal and maximal flux is calculated, and again all reactions carrying flux in these solutions are removed from the remaining ones.
+        @ reaction_list - list of reaction IDs or reactions to check, default all reactions of the model
+        @ n_random - maximal number of linear problems with random objectives
+        @ seed - the seed for the random objectives'''
+        self.sync_model()
+        if reaction_list is None:
+            reaction_list = self.active_ids()
+        else:
+            reaction_list = [x if type(x) == str else x.id for x in reaction_list]
+        rxn_idx = self.rxn_pos
+
+        # structural pruning: a reaction which is the only one able to produce or consume a metabolite can not carry flux in steady state
+        S = self.get_stoichiometry().tocoo()
+        met, rxn, coef = S.row, S.col, S.data
+        fwd = (self.ub > 0) & self.active
+        rev = (self.lb < 0) & self.active
+        n_met = S.shape[0]
+        while True:
+            active = fwd[rxn] | rev[rxn]
+            produces = ((coef > 0) & fwd[rxn]) | ((coef < 0) & rev[rxn])
+            consumes = ((coef > 0) & rev[rxn]) | ((coef < 0) & fwd[rxn])
+            n_active = np.bincount(met, weights = active, minlength = n_met)
+            n_produces = np.bincount(met, weights = produces, minlength = n_met)
+            n_consumes = np.bincount(met, weights = consumes, minlength = n_met)
+            dead = (n_active > 0) & ((n_produces == 0) | (n_consumes == 0) | (n_active == 1))
+            if not dead.any():
+                break
+            dead_rxn = np.unique(rxn[dead[met] & active])
+            fwd[dead_rxn] = False
+            rev[dead_rxn] = False
+        structural = set([x for x in reaction_list if not (fwd[rxn_idx[x]] or rev[rxn_idx[x]])])
+        candidates = [x for x in reaction_list if x not in structural]
+        n_lp = 0
+
+        # the forward and reverse variables of the reactions to check and their position in the solver
+        variables = {x : (self.model_ori.reactions[rxn_idx[x]].forward_variable, self.model_ori.reactions[rxn_idx[x]].reverse_variable) for x in candidates}
+        position = {var.name : i for i,var in enumerate(self.model_ori.variables)}
+        position = {x : (position[fwd_var.name], position[rev_var.name]) for x,(fwd_var, rev_var) in variables.items()}
+        # direction of the reactions which can carry flux only in one direction
+        sign = {x : 1 if fwd[rxn_idx[x]] else -1 for x in candidates if fwd[rxn_idx[x]] != rev[rxn_idx[x]]}
+
+        def carry_flux(candidates):
+            # remove all reactions from the candidates which carry flux in the current solution
+            # the primal values of all variables are fetched at once, which is much faster than asking each variable
+            primal = self.model_ori.solver._get_primal_values()
+            return([x for x in candidates if abs(primal[position[x][0]] - primal[position[x][1]]) < self.zero_cutoff])
+
+        with self.active_model() as model:
+            # same set up as the FVA in cobrapy with fraction_of_optimum = 0
+            model.slim_optimize(error_value = None,
+                    message = "There is no optimal solution for the chosen objective!")
+            n_lp = n_lp + 1
+            candidates = carry_flux(candidates)
+            if model.solver.objective.direction == "max":
+                old_objective = model.problem.Variable("fva_old_objective", lb = 0)
+            else:
+                old_objective = model.problem.Variable("fva_old_objective", ub = 0)
+            old_objective_constraint = model.problem.Constraint(model.solver.objective.expression - old_objective,
+                    lb = 0,
+                    ub = 0,
+                    name = "fva_old_objective_constraint")
+            model.add_cons_vars([old_objective, old_objective_constraint])
+            model.objective = Zero
+            objective = model.solver.objective
+
+            def optimize(weights, direction = "max"):
+                # optimizes the weighted sum of the fluxes of the reactions and returns the objective value
+                coefficients = {}
+                for x,w in weights.items():
+                    coefficients[variables[x][0]] = w
+                    coefficients[variables[x][1]] = -w
+                objective.set_linear_coefficients(coefficients)
+                objective.direction = direction
+                model.slim_optimize()
+                objective.set_linear_coefficients({var : 0 for var in coefficients})
+                cb.util.solver.check_solver_status(model.solver.status)
+                return(objective.value)
+
+            # random objectives - stop as soon as a problem does not find new reactions carrying flux
+            rng = np.random.default_rng(seed)
+            for i in range(n_random):
+                if len(candidates) == 0:
+                    break
+                optimize(dict(zip(candidates, rng.uniform(-1, 1, len(candidates)))))
+                n_lp = n_lp + 1
+                remaining = carry_flux(candidates)
+                found = len(candidates) - len(remaining)
+                candidates = remaining
+                if found == 0:
+                    break
+
+            # reactions which carry flux only in one direction are tested in groups - if the sum of their fluxes is below the cutoff, all of them are blocked. Otherwise the group is split until the reactions are decided
+            blocked = set()
+            groups = [[x for x in candidates if x in sign]]
+            while len(groups) > 0:
+                undecided = set(candidates)
+                group = [x for x in groups.pop() if x in undecided]
+                if len(group) == 0:
+                    continue
+                value = optimize({x : sign[x] for x in group})
+                n_lp = n_lp + 1
+                if value < self.zero_cutoff:
+                    blocked.update(group)
+                    candidates = [x for x in candidates if x not in blocked]
+                else:
+                    candidates = carry_flux(candidates)
+                    undecided = set(candidates)
+                    group = [x for x in group if x in undecided]
+                    # the flux is spread over several reactions - a single reaction left is tested below
+                    if len(group) > 1:
+                        groups.append(group[len(group)//2:])
+                        groups.append(group[:len(group)//2])
+
+            # maximize and minimize the flux of every reaction which is still undecided
+            while len(candidates) > 0:
+                rxn_id = candidates.pop(0)
+                is_blocked = True
+                for direction in ["max", "min"]:
+                    value = optimize({rxn_id : 1}, direction = direction)
+                    n_lp = n_lp + 1
+                    if abs(value) >= self.zero_cutoff:
+                        is_blocked = False
+                        candidates = carry_flux(candidates)
+                        break
+                if is_blocked:
+                    blocked.add(rxn_id)
+
+        print("# Found {n} blocked reactions ({s} without solving a linear problem) with {lp} linear problems".format(n = str(len(structural) + len(blocked)),
+            s = str(len(structural)),
+            lp = str(n_lp)))
+        return([x for x in reaction_list if x in structural or x in blocked])
+
+    def FVA_consistency(self, fast = None):
+        ''' Creates a consistent model using FVA - this is the default as it seems to produce most consistent results
+        @ fast - if True the blocked reactions are found with find_blocked_fast(), default see __init__()'''
         # use FVA to get a consistent model
+        if fast is None:
+            fast = self.fast_consistency
         
         print("# Creating consistent model using FVA")
-        init_rxn = len(self.model.reactions)
+        init_rxn = int(self.active.sum())
         tic = time.perf_counter()
-        blocked_rxns = cb.flux_analysis.find_blocked_reactions(self.model, zero_cutoff = self.zero_cutoff)
-        self.model.remove_reactions(blocked_rxns)
+        key = self.consistency_key("FVA")
+        blocked_rxns = self.get_cached_consistency(key)
+        if blocked_rxns is None:
+            if fast:
+                blocked_rxns = self.find_blocked_fast()
+            else:
+                with self.active_model() as model:
+                    blocked_rxns = cb.flux_analysis.find_blocked_reactions(model,
+                            reaction_list = [model.reactions[i] for i in np.where(self.active)[0]],
+                            zero_cutoff = self.zero_cutoff)
+            self.put_cached_consistency(key, blocked_rxns)
+        else:
+            print("# Found the blocked reactions in the consistency cache")
+        self.deactivate(blocked_rxns)
         toc = time.perf_counter()
-        cons_rxn = len(self.model.reactions)
+        cons_rxn = int(self.active.sum())
 
         print("# Reduced the initial model from {init} to {final} reactions ({frac}%) in the consistent model in {tictoc}s in the first fastcc run".format(init = str(init_rxn),
             final = str(cons_rxn),
@@ -152,8 +714,9 @@ class simpleFastcore():
         if "consistent" not in self.status: 
             self.status.append("consistent")
 
-    def fastcc_repeat(self):
-        '''This is a last resort attempt to create consistent model of the simpleFastcore object. It will run fastcc over and over until no inconsistent reactions can be found anymore. Use this with care, as this usually removes reactions which are actually not inconsistent and produces a different model for the context specific extraction process as basis''' 
+    def fastcc_repeat(self, incremental = False):
+        '''This is a last resort attempt to create consistent model of the simpleFastcore object. It will run fastcc over and over until no inconsistent reactions can be found anymore. Use this with care, as this usually removes reactions which are actually not inconsistent and produces a different model for the context specific extraction process as basis
+        @ incremental - if True, fastcc is run only once on the whole model. Afterwards only the reactions sharing a metabolite with the reactions removed in the previous iteration are checked with find_blocked_fast(), until no reaction is removed anymore''' 
         # this function wil return the consistent model
         
         # supress a warning which is usually thrown by cobrapy
@@ -162,26 +725,44 @@ class simpleFastcore():
         
         # get the number of reactions to initialize a loop and record some statistics
         tictic = time.perf_counter()
-        init_rxn = len(self.model.reactions) 
-        cons_rxn = init_rxn +1
-        current_rxns = init_rxn
+        init_rxn = int(self.active.sum())
+        cons_rxn = init_rxn
+        current_rxns = init_rxn +1
         print("# Creating consistent model using repeating fastcc")
         i = self.fastcc_runs
+        frontier = None
         print("Iteration\tNoInputRxns\tNoOutputRxn\tFracReduced\tTimeNeeded")
 
         while cons_rxn != current_rxns:
             current_rxns = cons_rxn
             i = i+1
             tic = time.perf_counter()
-            self.model = cb.flux_analysis.fastcc(model = self.model, zero_cutoff = self.zero_cutoff)
+            if frontier is None:
+                with self.active_model() as model:
+                    consistent = cb.flux_analysis.fastcc(model = model, zero_cutoff = self.zero_cutoff)
+                kept = set([x.id for x in consistent.reactions])
+                removed = [x for x in self.active_ids() if x not in kept]
+            else:
+                with self.suppress_stdout_stderr():
+                    removed = self.find_blocked_fast(reaction_list = frontier)
+            # fastcc removes the orphaned metabolites as well
+            self.deactivate(removed, remove_orphans = frontier is None)
+            if incremental:
+                # the reactions which share a metabolite with the removed reactions are the only ones which might be blocked now
+                S = self.get_stoichiometry()
+                mets = np.unique(S[:, [self.rxn_pos[x] for x in removed]].nonzero()[0])
+                neighbours = np.unique(S.tocsr()[mets, :].nonzero()[1])
+                frontier = list(self.rxn_ids[neighbours[self.active[neighbours]]])
             toc = time.perf_counter()
 
-            cons_rxn = len(self.model.reactions)
+            cons_rxn = int(self.active.sum())
             print(str(i)+ "\t" +
                     str(current_rxns) + "\t" +
                     str(cons_rxn) + "\t" + 
                     str(round(1-cons_rxn/current_rxns,3)) + "\t" +
                     str(round(toc-tic,2)))
+            if frontier is not None and len(frontier) == 0:
+                break
 
         print("# Reduced the initial model from {init} to {final} reactions ({frac}%) in the consistent model in {tictoc}s with {no} fastcc runs".format(init = str(init_rxn),
             final = str(cons_rxn),
@@ -205,36 +786,38 @@ class simpleFastcore():
 
         tic = time.perf_counter()
         # initiate the fastcore model extractor 
-        S = cb.util.create_stoichiometric_matrix(self.model)
-        lb = [x.lower_bound for x in self.model.reactions]
-        ub = [x.upper_bound for x in self.model.reactions]
-        with self.suppress_stdout_stderr(): # remove the noise from the troppo fastcore implementation
-            fastcoresolver = FASTcore(S, lb, ub, # this is everything which is needed from the model
-                    FastcoreProperties(core= self.core_idx,
-                        solver = self.solver,
-                        flux_threshold = self.zero_cutoff)
-                    )
-
-            # run fastcore
-            specific_idx = fastcoresolver.fastcore()
+        S, lb, ub = self.get_arrays()
+        specific_idx = self.fastcore_idx(S, lb, ub, self.core_idx)
 
         self.specific_idx_caMod = specific_idx
         toc = time.perf_counter()
         print("# Fastcore was done in {tictoc}s, will adjust the model".format(tictoc = str(round(toc-tic,3))))
 
-        # get the specific model
-        rm_rxns = [x for i,x in enumerate(self.model.reactions) if i not in specific_idx]
-        self.model.remove_reactions(rm_rxns)
-        
-        if len(specific_idx) != len(self.model.reactions):
-            warnings.warn("Something odd happened and the reactions extracted by fastcore and the ones which remained in the model have not the same length. Please check the results carefully!")
+        # get the specific model - only the reactions are marked, the cobra model is created on request
+        active_idx = np.where(self.active)[0]
+        self.active[:] = False
+        self.active[active_idx[list(specific_idx)]] = True
+        self.current_model = None
 
         self.status.append("context_specific")
 
+    def get_arrays(self):
+        ''' Returns the stoichiometric matrix (scipy.sparse CSR) and the lists of lower and upper bounds of the current model - this is everything fastcore needs from the model'''
+        self.sync_model()
+        idx = np.where(self.active)[0]
+        S = self.get_stoichiometry()[np.where(self.met_active)[0], :][:, idx].tocsr()
+        return(S, self.lb[idx], self.ub[idx])
+
+    def fastcore_idx(self, S, lb, ub, core_idx):
+        ''' Runs fastcore with the engine given in __init__() on the stoichiometric matrix S with the bounds lb and ub and returns the indices of the reactions in the context specific model
+        @ core_idx - list of indices of the core reactions in S'''
+        engine = fastcore_engines[self.engine](S, lb, ub, solver = self.solver, zero_cutoff = self.zero_cutoff)
+        return(engine.fastcore(core_idx))
+
     def get_model(self):
         ''' Returns a copy of the model'''
 
-        return(self.model.copy())
+        return(self.build_model(np.where(self.active)[0]))
 
     def run(self):
         ''' Runs the complete fastcore pipeline - makes the model consistent, and extracts the context specific model with fastcore - returns a copy of the context specific model'''
@@ -268,5 +851,159 @@ class simpleFastcore():
 
         toc = time.perf_counter()
         print("# Total runtime: " + str(round(toc-tic,3)) + "s")
-        return(self.model.copy())
-        
+        return(self.get_model())
+
+
+class batchFastcore(simpleFastcore):
+    ''' Extracts context specific models for many core sets from the same model. The model is copied and made consistent only once and the stoichiometric matrix and bounds are created only once, afterwards fastcore is run for each core set and only the indices of the reactions of each context specific model are stored. The cobra models are created only on request with self.get_model(name).
+    @ model - the cobra.Model to extract the context specific models from
+    @ core_sets - the core sets, either a dictionary with name:list of reaction IDs pairs, a list of lists of reaction IDs, a pandas.DataFrame with reactions in rows and samples in columns containing 0/1 (as returned by coreSetFinder.getCoreSet()), a packedCoreSet or a matrixIO.matrixFile of such a pandas.DataFrame
+    @ consistency - the method to create the consistent model, one of "FVA" (default, see FVA_consistency()), "fastcc", "fastcc_repeat" or "fastcc_incremental" (see fastcc_repeat(incremental = True))
+    @ engine - the fastcore implementation, by default "native" (see nativeFastcore), which gives the same reactions as "troppo", but needs no dense copy of the stoichiometric matrix in the workers and is faster
+    Other arguments see simpleFastcore.
+    '''
+    def __init__(self, model, core_sets = {}, max_boundaries = 1000, zero_cutoff = None, consistency = "FVA", consistency_cache = None, fast_consistency = False, engine = "native"):
+        simpleFastcore.__init__(self, model, core_set = [], max_boundaries = max_boundaries, zero_cutoff = zero_cutoff, consistency_cache = consistency_cache, fast_consistency = fast_consistency, engine = engine)
+        if consistency not in ["FVA", "fastcc", "fastcc_repeat", "fastcc_incremental"]:
+            raise ValueError("consistency must be one of: 'FVA', 'fastcc', 'fastcc_repeat', 'fastcc_incremental'")
+        self.consistency = consistency
+        self.set_core_sets(core_sets)
+
+    def load_model(self, model):
+        ''' Copies the model and initializes the state for it - all previous steps and results are discarded'''
+        simpleFastcore.load_model(self, model)
+        self.reset_results()
+
+    def reset_results(self):
+        ''' Discards the results and the arrays of the consistent model'''
+        self.results = {}
+        self.failed = {}
+        self.times = {}
+        self.arrays = None
+        self.fastcore_engine = None
+
+    def sync_model(self):
+        ''' Takes over the changes of self.model (see simpleFastcore.sync_model()) - the results of the previous model are discarded'''
+        changed = simpleFastcore.sync_model(self)
+        if changed:
+            self.reset_results()
+        return(changed)
+
+    def set_core_sets(self, core_sets):
+        ''' Sets the core sets, see __init__() for the possible formats'''
+        core_sets = asFrame(core_sets)
+        if isinstance(core_sets, packedCoreSet):
+            self.core_sets = {x : core_sets.core_set(x) for x in core_sets.columns}
+        elif isinstance(core_sets, pd.DataFrame):
+            self.core_sets = {x : list(core_sets.index[core_sets[x] == 1]) for x in core_sets.columns}
+        elif type(core_sets) == dict:
+            self.core_sets = dict(core_sets)
+        else:
+            self.core_sets = {i : x for i,x in enumerate(core_sets)}
+
+    def make_consistent(self):
+        ''' Creates the consistent model with the method given in __init__() and the stoichiometric matrix and bounds for fastcore - this is done only once for all core sets'''
+        self.sync_model()
+        if "consistent" not in self.status:
+            if self.consistency == "FVA":
+                self.FVA_consistency()
+            elif self.consistency == "fastcc":
+                self.fastcc()
+            else:
+                self.fastcc_repeat(incremental = self.consistency == "fastcc_incremental")
+        if self.arrays is None:
+            self.arrays = self.get_arrays()
+            self.consistent_idx = np.where(self.active)[0]
+            self.rxn_idx = {x : i for i,x in enumerate(self.rxn_ids[self.consistent_idx])}
+
+    def get_core_idx(self, core_set):
+        ''' Returns the indices of the core set in the consistent model
+        @ core_set - list of reaction IDs or integers corresponding to the index of the reactions in the original model'''
+        self.make_consistent()
+        if all([True if type(x) == int else False for x in core_set]):
+            core_set = [self.model_ori.reactions[i].id for i in core_set]
+        core_idx = sorted(set([self.rxn_idx[x] for x in core_set if x in self.rxn_idx]))
+        if len(core_idx) == 0:
+            raise ValueError("No core set left in the model provided, check your input!")
+        return(core_idx)
+
+    def fastcore_core_set(self, core_set):
+        ''' Runs fastcore on the consistent model for a single core set and returns the indices of the reactions in the context specific model
+        @ core_set - list of reaction IDs or integers corresponding to the index of the reactions in the original model'''
+        core_idx = self.get_core_idx(core_set)
+        return(sorted([int(x) for x in self.get_engine().fastcore(core_idx)]))
+
+    def get_engine(self):
+        ''' Returns the fastcore engine for the consistent model - it is created only once and used for all core sets'''
+        self.make_consistent()
+        if self.fastcore_engine is None:
+            S, lb, ub = self.arrays
+            self.fastcore_engine = fastcore_engines[self.engine](S, lb, ub, solver = self.solver, zero_cutoff = self.zero_cutoff)
+        return(self.fastcore_engine)
+
+    @staticmethod
+    def init_worker(S, lb, ub, solver, zero_cutoff, engine = "native"):
+        ''' Creates the fastcore engine of a worker process of iter_run() - it is created only once per worker and used for all core sets the worker gets'''
+        return(fastcore_engines[engine](S, lb, ub, solver = solver, zero_cutoff = zero_cutoff))
+
+    @staticmethod
+    def run_worker(engine, core_idx):
+        ''' Runs fastcore for a single core set with the fastcore engine of a worker process of iter_run() and returns the sorted indices of the reactions'''
+        return(sorted([int(x) for x in engine.fastcore(core_idx)]))
+
+    def iter_run(self, num_cores = 1):
+        ''' Runs fastcore for all core sets which have no result yet and yields the results as soon as they are finished as tuples of (name, list of indices of the reactions in the consistent model, runtime in s, error). If fastcore fails for a core set, the list of indices is None and error contains the description of the exception.
+        @ num_cores - number of worker processes - each worker gets the stoichiometric matrix and bounds only once. If num_cores = 1, everything is run in the current process.'''
+        self.make_consistent()
+        tasks = {}
+        for name in [x for x in self.core_sets.keys() if x not in self.results]:
+            try:
+                tasks[name] = self.get_core_idx(self.core_sets[name])
+            except ValueError as exception:
+                yield((name, None, 0, repr(exception)))
+
+        S, lb, ub = self.arrays
+        yield from iterTasks(batchFastcore.run_worker, tasks,
+                setup = batchFastcore.init_worker,
+                args = (S, lb, ub, self.solver, self.zero_cutoff, self.engine),
+                num_cores = num_cores,
+                state = self.get_engine() if num_cores <= 1 else None)
+
+    def run(self, num_cores = 1):
+        ''' Runs fastcore for all core sets - returns a dictionary with name:list of indices of the reactions in the consistent model (see self.model) for each core set. Core sets for which fastcore failed are reported and stored with the error in self.failed, the runtime for each core set is stored in self.times.
+        @ num_cores - number of worker processes, see iter_run()'''
+        tic = time.perf_counter()
+        todo = len([x for x in self.core_sets.keys() if x not in self.results])
+        for i, (name, specific_idx, runtime, error) in enumerate(self.iter_run(num_cores = num_cores)):
+            self.times[name] = runtime
+            if error is None:
+                self.results[name] = specific_idx
+                self.failed.pop(name, None)
+                print("# [{i}/{n}] Fastcore for {name} was done in {tictoc}s and kept {k} reactions".format(i = str(i+1),
+                    n = str(todo),
+                    name = str(name),
+                    tictoc = str(round(runtime,3)),
+                    k = str(len(specific_idx))))
+            else:
+                self.failed[name] = error
+                print("# [{i}/{n}] Fastcore for {name} failed: {error}".format(i = str(i+1),
+                    n = str(todo),
+                    name = str(name),
+                    error = error))
+        toc = time.perf_counter()
+        print("# Total runtime: " + str(round(toc-tic,3)) + "s")
+        if len(self.failed) > 0:
+            warnings.warn("WARNING: Fastcore failed for {n} core sets, see self.failed".format(n = str(len(self.failed))))
+        if "context_specific" not in self.status:
+            self.status.append("context_specific")
+        return(self.results)
+
+    def get_reactions(self, name):
+        ''' Returns the reaction IDs of the context specific model for the core set name'''
+        return(list(self.rxn_ids[self.consistent_idx[self.results[name]]]))
+
+    def get_model(self, name = None):
+        ''' Returns the context specific model for the core set name as cobra.Model - if name is None, a copy of the consistent model is returned'''
+        if name is None:
+            return(simpleFastcore.get_model(self))
+        return(self.build_model(self.consistent_idx[self.results[name]]))
@@ -0,0 +1,50 @@
+# running many independent tasks (core sets, samples) on the same large data (model, stoichiometric matrix) in worker processes
+
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# the state of a worker process, created once by initWorker()
+worker_state = {}
+
+def initWorker(setup, args):
+    ''' Initializes a worker process of iterTasks() - the state is created only once per worker and used for all tasks the worker gets'''
+    worker_state["state"] = setup(*args)
+
+def runTask(function, state, name, task):
+    ''' Runs function(state, task) and returns (name, result, runtime in s, error) - errors are returned instead of raised, so that a single failing task does not stop the others'''
+    tic = time.perf_counter()
+    try:
+        return(name, function(state, task), time.perf_counter()-tic, None)
+    except Exception as exception:
+        return(name, None, time.perf_counter()-tic, repr(exception))
+
+def runWorkerTask(function, name, task):
+    ''' Runs a task with the state of the worker process, see runTask()'''
+    return(runTask(function, worker_state["state"], name, task))
+
+def iterTasks(function, tasks, setup, args = (), num_cores = 1, state = None):
+    ''' Runs function(state, task) for all tasks and yields the results as soon as they are finished as tuples of (name, result, runtime in s, error). If a task fails, the result is None and error contains the description of the exception.
+    @ function - the function to run for each task, must be defined on module level or as staticmethod to be sent to the workers
+    @ tasks - dictionary of name:task
+    @ setup - function which creates the state from args, it is called only once in each worker process - the large data should be in args, which are sent only once to each worker
+    @ args - tuple of the arguments of setup
+    @ num_cores - number of worker processes. If num_cores = 1, everything is run in the current process.
+    @ state - the state to use if num_cores = 1, setup(*args) if None
+    '''
+    if num_cores <= 1:
+        if state is None:
+            state = setup(*args)
+        for name, task in tasks.items():
+            yield(runTask(function, state, name, task))
+        return
+
+    with ProcessPoolExecutor(max_workers = num_cores,
+            initializer = initWorker,
+            initargs = (setup, args)) as pool:
+        futures = {pool.submit(runWorkerTask, function, name, task) : name for name, task in tasks.items()}
+        for future in as_completed(futures):
+            try:
+                yield(future.result())
+            except Exception as exception:
+                # the worker process died
+                yield((futures[future], None, 0, repr(exception)))
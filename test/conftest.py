@@ -0,0 +1,2 @@
+# the scripts test_GPRmapping.py and test_fastcore.py are interactive sessions on local data, not tests
+collect_ignore = ["test_GPRmapping.py", "test_fastcore.py"]
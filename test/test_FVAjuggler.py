@@ -0,0 +1,191 @@
+# regression checks for the FVAjuggler on the textbook model
+
+import io
+import contextlib
+import numpy as np
+import pandas as pd
+import scipy.cluster.hierarchy as spc
+import cobra as cb
+import corpse
+
+model = cb.io.load_model("textbook")
+rxns = [x.id for x in model.reactions]
+
+def fva(n_samples = 7, seed = 0):
+    # FVA ranges with fixed fluxes (min == max) and reactions without variance between the samples
+    rng = np.random.default_rng(seed)
+    mins = np.round(rng.normal(size = (len(rxns), n_samples)), 1)
+    maxs = mins + np.round(rng.random((len(rxns), n_samples)), 1)
+    fixed = rng.random(mins.shape) < 0.2
+    maxs[fixed] = mins[fixed]
+    mins[:10,:] = mins[:10,:1]
+    maxs[:10,:] = maxs[:10,:1]
+    samples = ["s" + str(i) for i in range(n_samples)]
+    return(pd.DataFrame(mins, index = rxns, columns = samples), pd.DataFrame(maxs, index = rxns, columns = samples))
+
+def loopSampleMoors(min1, min2, max1, max2):
+    # the distance functions of the original FVAjuggler
+    idx = range(np.size(min1))
+    d = np.sum(pd.DataFrame({"min" : np.absolute(min1-min2), "max": np.absolute(max1-max2)}, index = idx), 1)
+    m = np.sum(pd.DataFrame({"x1" : max1-min1, "x2" : max2 - min2}, index = idx), 1)
+    nonzero = list(m != 0)
+    d.loc[nonzero] = d.loc[nonzero]/m.loc[nonzero]
+    return(d)
+
+def loopSampleTaub(min1, min2, max1, max2):
+    idx = range(np.size(min1))
+    d = np.max(pd.DataFrame({"x1" : min1-max1, "x2" : min1 - max2, "x3" : min2 - max1, "x4" : min2 - max2}, index = idx), 1)
+    m = np.mean(pd.DataFrame({"x1" : max1-min1, "x2" : max2 - min2}, index = idx), 1)
+    nonzero = list(m != 0)
+    d.loc[nonzero] = d.loc[nonzero]/m.loc[nonzero]
+    d.loc[[not x for x in nonzero]] = -1
+    return(np.log2(d+2))
+
+def loopSampleJacc(min1, min2, max1, max2):
+    idx = range(np.size(min1))
+    d = np.max(pd.DataFrame({"x1" : min1-max1, "x2" : min1 - max2, "x3" : min2 - max1, "x4" : min2 - max2}, index = idx), 1)
+    d[d>0] = -0
+    d = d*-1
+    m = np.sum(pd.DataFrame({"x1" : max1-min1, "x2" : max2 - min2}, index = idx), 1)
+    nonzero = list(m != 0)
+    d.loc[nonzero] = d.loc[nonzero]/m.loc[nonzero]
+    return(d)
+
+def loopFVAdist(min_mat, max_mat, dist_method):
+    # the sample pair loop of the original calcFVAdistPerSamplePair()
+    funcs = {"Moors" : loopSampleMoors, "Taub" : loopSampleTaub, "Jacc" : loopSampleJacc}
+    samples = min_mat.shape[1]
+    d3 = np.zeros((samples, samples, min_mat.shape[0]))
+    for i in range(samples-1):
+        for j in range(i+1, samples):
+            d3[i,j,:] = d3[j,i,:] = funcs[dist_method](min_mat.values[:,i], min_mat.values[:,j], max_mat.values[:,i], max_mat.values[:,j])
+    return(d3)
+
+def test_calcFVAdist_equals_loop():
+    juggler = corpse.FVAjuggler()
+    min_mat, max_mat = fva()
+    for dist_method in ["Moors", "Taub", "Jacc"]:
+        ref = loopFVAdist(min_mat, max_mat, dist_method)
+        assert np.allclose(juggler.calcFVAdist(min_mat, max_mat, dist_method = dist_method), ref, rtol = 1E-12, atol = 0), dist_method
+        # small blocks of reactions give the same result
+        assert np.allclose(juggler.calcFVAdist(min_mat, max_mat, dist_method = dist_method, block_size = 7), ref, rtol = 1E-12, atol = 0), dist_method
+        pair = juggler.pairDist(min_mat.values[:,1], min_mat.values[:,4], max_mat.values[:,1], max_mat.values[:,4], dist_method)
+        assert np.allclose(pair, ref[1,4,:], rtol = 1E-12, atol = 0), dist_method
+
+def test_condensed_equals_calcFVAdist(tmp_path):
+    juggler = corpse.FVAjuggler()
+    min_mat, max_mat = fva()
+    for dist_method in ["Moors", "Taub", "Jacc"]:
+        ref = juggler.calcFVAdist(min_mat, max_mat, dist_method = dist_method)
+        dist = juggler.calcFVAdistCondensed(min_mat, max_mat, dist_method = dist_method, block_size = 7)
+        assert np.array_equal(dist.to_array(), ref), dist_method
+        assert np.array_equal(dist.pairDist("s4", "s1").values, ref[1,4,:])
+        assert np.array_equal(dist.rxnDist("PFK", square = True).values, ref[:,:,rxns.index("PFK")])
+    # the memory map is opened again with the names
+    juggler.calcFVAdistCondensed(min_mat, max_mat, path = str(tmp_path / "dist.npy"), dtype = "float32")
+    loaded = juggler.loadDist(str(tmp_path / "dist.npy"))
+    assert loaded.index == rxns and loaded.columns == list(min_mat.columns)
+    assert np.allclose(loaded.to_array(), juggler.calcFVAdist(min_mat, max_mat), rtol = 1E-6)
+
+def test_reduceFVAdist_equals_numpy():
+    juggler = corpse.FVAjuggler()
+    min_mat, max_mat = fva()
+    d3 = juggler.calcFVAdist(min_mat, max_mat, dist_method = "Taub")
+    # the distances of the sample pairs (upper triangle) for each reaction
+    i,j = np.triu_indices(d3.shape[0], 1)
+    pairs = d3[i,j,:]
+    reducers = {"mean" : lambda x, axis: np.mean(x, axis = axis),
+            "sum" : lambda x, axis: np.sum(x, axis = axis),
+            "max" : lambda x, axis: np.max(x, axis = axis),
+            "quantile" : lambda x, axis: np.quantile(x, 0.3, axis = axis)}
+    for reducer, func in reducers.items():
+        for block_size in [None, 4]:
+            res = juggler.reduceFVAdist(min_mat, max_mat, dist_method = "Taub", reducer = reducer, q = 0.3, block_size = block_size)
+            ref = func(pairs, 1)
+            assert list(res.index) == list(min_mat.columns)
+            assert np.allclose(res.values[i,j], ref, rtol = 1E-12, atol = 0), reducer
+            assert np.allclose(juggler.reduceFVAdist(min_mat, max_mat, dist_method = "Taub", reducer = reducer, q = 0.3, square = False, block_size = block_size), ref, rtol = 1E-12, atol = 0), reducer
+            res = juggler.reduceFVAdist(min_mat, max_mat, dist_method = "Taub", reducer = reducer, axis = "pairs", q = 0.3, block_size = block_size)
+            assert list(res.index) == rxns
+            assert np.allclose(res.values, func(pairs, 0), rtol = 1E-12, atol = 0), reducer
+
+def linkageCluster(min_mat, max_mat, thrld):
+    # the linkage clustering of the original clusterFVA()
+    min_mat = min_mat.where(np.absolute(min_mat) >= 1E-6, 0)
+    max_mat = max_mat.where(np.absolute(max_mat) >= 1E-6, 0)
+    # np.var of a constant row can be slightly above 0, rowVariance() gives exactly 0
+    sel = (min_mat.nunique(axis = 1) > 1) | (max_mat.nunique(axis = 1) > 1)
+    min_max = pd.concat([min_mat.loc[sel,:], max_mat.loc[sel,:]], axis = 1)
+    corMatAb = np.absolute(min_max.transpose().corr())
+    linkage = spc.linkage(min_max, method = "complete", metric = "correlation")
+    idx = spc.fcluster(linkage, 1-thrld, "distance")
+    centers = []
+    for i in range(min(idx), max(idx)+1):
+        mat = corMatAb.loc[idx == i, idx == i]
+        sums = np.sum(mat, 1)
+        centers.append(mat.index[np.where(sums == np.amax(sums))[0][0]])
+    return(centers, {corMatAb.index[i]:x for i,x in enumerate(idx)})
+
+def test_clusterFVA_equals_linkage():
+    juggler = corpse.FVAjuggler()
+    min_mat, max_mat = fva(n_samples = 12)
+    for thrld in [0.5, 0.75]:
+        centers, cluster = linkageCluster(min_mat, max_mat, thrld)
+        a, b, res = juggler.clusterFVA(min_mat, max_mat, thrld = thrld, method = "complete")
+        assert res == cluster
+        assert list(a.index) == centers and list(b.index) == centers
+        assert np.array_equal(a.values, min_mat.loc[centers,:].values)
+    # leader clustering - all reactions of a cluster correlate with its first reaction
+    a, b, res = juggler.clusterFVA(min_mat, max_mat, thrld = 0.5, method = "leader")
+    min_max = pd.concat([min_mat, max_mat], axis = 1).loc[list(res.keys()),:]
+    cor = min_max.transpose().corr()
+    for number in set(res.values()):
+        members = [x for x,y in res.items() if y == number]
+        assert (cor.loc[members[0], members] >= 0.5 - 1E-6).all()
+
+def test_filterFVA_keeps_input(tmp_path):
+    juggler = corpse.FVAjuggler()
+    min_mat, max_mat = fva()
+    # numerical noise, which is set to 0 in the filtered matrices
+    min_mat.iloc[20,:] = 1E-9
+    max_mat.iloc[20,:] = 0
+    max_mat.iloc[20,:3] = -1E-8
+    min_mat.iloc[30,0] = 1E-9
+    min_copy, max_copy = min_mat.copy(), max_mat.copy()
+    a, b = juggler.filterFVA(min_mat, max_mat)
+    assert min_mat.equals(min_copy) and max_mat.equals(max_copy)
+    assert list(a.index) == [x for x in rxns[10:] if x != rxns[20]]
+    assert a.loc[rxns[30],"s0"] == 0 and min_mat.iloc[30,0] == 1E-9
+    assert np.array_equal(a.values, min_mat.loc[a.index,:].where(np.absolute(min_mat) >= 1E-6, 0).values)
+    # numpy arrays and memory maps are not changed either
+    a, b = juggler.filterFVA(min_mat.values, max_mat.values, method = "all")
+    assert np.array_equal(min_mat.values, min_copy.values) and np.array_equal(max_mat.values, max_copy.values)
+    corpse.writeMatrix(max_mat, str(tmp_path / "max.npy"))
+    b_file = juggler.filterFVA(min_mat, str(tmp_path / "max.npy"), method = "all")[1]
+    assert np.array_equal(b_file.values, b)
+    assert np.array_equal(np.load(str(tmp_path / "max.npy")), max_copy.values)
+
+def test_cohortFVA_equals_FVA(tmp_path):
+    juggler = corpse.FVAjuggler()
+    removed = ["PFK", "FUM", "ME1"]
+    samples = {"anaerobic" : {"EX_o2_e" : (0, 1000)},
+            "glucose" : {"EX_glc__D_e" : (-5, 1000), "ATPM" : (2, 1000)},
+            "removed" : [x for x in rxns if x not in removed],
+            "bad" : {"no_such_reaction" : (0, 0)}}
+    with contextlib.redirect_stdout(io.StringIO()):
+        min_mat, max_mat = juggler.cohortFVA(model, samples, fraction_of_optimum = 0.9, path = str(tmp_path / "fva"))
+        pool = corpse.FVAjuggler().cohortFVA(model, samples, fraction_of_optimum = 0.9, num_cores = 2)
+    assert list(juggler.failed.keys()) == ["bad"] and min_mat["bad"].isna().all()
+    for name in ["anaerobic", "glucose", "removed"]:
+        mod = model.copy()
+        if name == "removed":
+            mod.remove_reactions([mod.reactions.get_by_id(x) for x in removed])
+        else:
+            for rxn, bounds in samples[name].items():
+                mod.reactions.get_by_id(rxn).bounds = bounds
+        ref = cb.flux_analysis.flux_variability_analysis(mod, fraction_of_optimum = 0.9, processes = 1).reindex(rxns, fill_value = 0)
+        assert np.allclose(min_mat[name], ref["minimum"], atol = 1E-6), name
+        assert np.allclose(max_mat[name], ref["maximum"], atol = 1E-6), name
+    # the linear problems of the workers start from other solutions, thus the fluxes are only equal within the tolerance
+    assert np.allclose(pool[0], min_mat, atol = 1E-6, equal_nan = True) and np.allclose(pool[1], max_mat, atol = 1E-6, equal_nan = True)
+    assert corpse.openMatrix(str(tmp_path / "fva_max.npy")).to_frame().equals(max_mat)
@@ -0,0 +1,51 @@
+# regression checks for the coreSetFinder on the textbook model
+
+import numpy as np
+import pandas as pd
+import cobra as cb
+import corpse
+
+model = cb.io.load_model("textbook")
+rxns = [x.id for x in model.reactions]
+
+def activity(n_samples = 12, seed = 0):
+    rng = np.random.default_rng(seed)
+    return(pd.DataFrame(rng.lognormal(size = (len(rxns), n_samples)), index = rxns, columns = ["s" + str(i) for i in range(n_samples)]))
+
+def loopCoreSet(array, global_lower, global_upper = None, local = None):
+    # the gene by gene loop of the original getCoreSet()
+    resDF = array > np.percentile(np.array(array), global_lower)
+    if local != None:
+        for gene in array.index:
+            localt = np.percentile(array.loc[gene], local)
+            resDF.loc[gene,:] = [bool(x and y) for x,y in zip(array.loc[gene] > localt, resDF.loc[gene])]
+    if global_upper != None:
+        resDF[array > np.percentile(np.array(array), global_upper)] = True
+    return(resDF.astype(int))
+
+def test_getCoreSet_equals_loop():
+    finder = corpse.coreSetFinder()
+    df = activity()
+    for gl, gu, l in [(0, None, None), (25, None, None), (25, None, 50), (10, 90, 50), (25, 75, 60)]:
+        res, string = finder.getCoreSet(df, global_lower = gl, global_upper = gu, local = l)
+        assert res.equals(loopCoreSet(df, gl, gu, l)), string
+
+def test_sweep_equals_getCoreSet():
+    finder = corpse.coreSetFinder()
+    df = activity()
+    res, strings = finder.sweepCoreSets(df, global_lower = [10, 25], global_upper = [None, 90], local = [None, 50])
+    for gl, gu, l in [(10, None, None), (25, 90, 50), (10, None, 50)]:
+        ref, string = finder.getCoreSet(df, global_lower = gl, global_upper = gu, local = l)
+        assert np.array_equal(res[strings.index(string)], ref.values.astype(bool)), string
+
+def test_packed_core_set_round_trip(tmp_path):
+    finder = corpse.coreSetFinder()
+    df = activity(n_samples = 13) # not a multiple of 8 genes/rxns and samples
+    ref, string = finder.getCoreSet(df, global_lower = 25, global_upper = 90, local = 50)
+    packed, packed_string = finder.getCoreSet(df, global_lower = 25, global_upper = 90, local = 50, compact = True)
+    assert packed_string == string
+    packed.save(str(tmp_path / "core_sets.npz"))
+    loaded = finder.loadCoreSet(str(tmp_path / "core_sets.npz"))
+    assert loaded.to_frame().equals(ref)
+    assert loaded.core_set("s3") == list(ref.index[ref["s3"] == 1])
+    assert list(loaded.counts()) == list(ref.sum(axis = 0))
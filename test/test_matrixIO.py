@@ -0,0 +1,59 @@
+# regression checks for the binary matrix files on the textbook model
+
+import numpy as np
+import pandas as pd
+import cobra as cb
+import pytest
+import corpse
+
+model = cb.io.load_model("textbook")
+rxns = [x.id for x in model.reactions]
+
+def ras(n_samples = 9, seed = 0):
+    rng = np.random.default_rng(seed)
+    return(pd.DataFrame(rng.random((len(rxns), n_samples)), index = rxns, columns = ["s" + str(i) for i in range(n_samples)]))
+
+@pytest.mark.parametrize("extension", [".npy", ".parquet", ".feather"])
+def test_round_trip(tmp_path, extension):
+    if extension != ".npy":
+        pytest.importorskip("pyarrow")
+    df = ras()
+    path = str(tmp_path / ("ras" + extension))
+    written = corpse.writeMatrix(df, path)
+    matrix = corpse.openMatrix(path)
+    assert matrix.shape == df.shape and written.shape == df.shape
+    assert matrix.to_frame().equals(df)
+    assert matrix.to_frame(columns = ["s4", 1]).equals(df[["s4", "s1"]])
+    chunks = list(matrix.columnChunks(chunk_size = 4))
+    assert [x.shape[1] for x in chunks] == [4, 4, 1]
+    assert pd.concat(chunks, axis = 1).equals(df)
+    assert np.array_equal(np.asarray(matrix), df.values)
+    # no temporary files are left
+    assert sorted(x.name for x in tmp_path.iterdir()) == sorted(["ras" + extension, "ras" + extension + ".json"])
+
+def test_numpy_and_objects(tmp_path):
+    df = ras()
+    # numpy arrays get the row and column numbers as names, which are stored as strings like all names
+    matrix = corpse.writeMatrix(df.values, str(tmp_path / "values.npy"))
+    assert matrix.index == [str(x) for x in range(df.shape[0])] and matrix.columns == [str(x) for x in range(df.shape[1])]
+    assert np.array_equal(matrix.array(columns = [2, "5"]), df.values[:,[2,5]])
+    # objects with to_frame() are written as pandas.DataFrame
+    core_sets, string = corpse.coreSetFinder().getCoreSet(df, global_lower = 25, compact = True)
+    matrix = corpse.writeMatrix(core_sets, str(tmp_path / "core_sets.npy"))
+    assert matrix.to_frame().equals(core_sets.to_frame())
+    # the path of the file can be used instead of the pandas.DataFrame
+    corpse.writeMatrix(df, str(tmp_path / "ras.npy"))
+    ref, string = corpse.coreSetFinder().getCoreSet(df, global_lower = 25, local = 50)
+    res, string = corpse.coreSetFinder().getCoreSet(str(tmp_path / "ras.npy"), global_lower = 25, local = 50)
+    assert res.equals(ref)
+    with pytest.raises(ValueError):
+        corpse.writeMatrix(df, str(tmp_path / "ras.csv"))
+
+def test_failed_write_leaves_no_file(tmp_path):
+    path = str(tmp_path / "ras.npy")
+    with pytest.raises(RuntimeError):
+        with corpse.matrixIO.atomicWrite(path) as tmp:
+            with open(tmp, "wb") as fh:
+                np.save(fh, np.zeros(3))
+            raise RuntimeError("interrupted")
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,114 @@
+# regression checks for the omicsMapper on the textbook model
+
+import os
+import numpy as np
+import pandas as pd
+import cobra as cb
+import corpse
+from corpse.omicsMapper import rasCache
+
+model = cb.io.load_model("textbook")
+genes = [x.id for x in model.genes]
+
+def expression(n_samples = 8, seed = 0):
+    rng = np.random.default_rng(seed)
+    return(pd.DataFrame(rng.random((len(genes), n_samples)), index = genes, columns = ["s" + str(i) for i in range(n_samples)]))
+
+def test_stream_numpy_chunks():
+    # numpy sources have integer sample names, which must not be taken as positions within the chunk
+    mapper = corpse.omicsMapper()
+    df = expression()
+    ref = mapper.mapExpressionToReaction(model, df, backend = "serial")
+    for engine in ["samplewise", "vectorized", "sparse"]:
+        out = []
+        mapper.mapExpressionStream(model, df.values, out.append, chunk_size = 3, index = genes, engine = engine)
+        res = pd.concat(out, axis = 1)
+        assert len(out) == 3
+        assert list(res.columns) == list(range(df.shape[1]))
+        assert np.allclose(res.values, ref.values)
+
+def randomGPR(rng, genes, depth = 3):
+    # random nested GPR with and without parenthesis
+    if depth == 0 or rng.random() < 0.3:
+        return(str(rng.choice(genes)))
+    terms = [randomGPR(rng, genes, depth-1) for i in range(rng.integers(2, 4))]
+    gpr = terms[0]
+    for term in terms[1:]:
+        gpr = gpr + " " + str(rng.choice(["and", "or"])) + " " + term
+    return("( " + gpr + " )" if rng.random() < 0.5 else gpr)
+
+def test_compiled_gpr_equals_mapGPR():
+    mapper = corpse.omicsMapper()
+    rng = np.random.default_rng(1)
+    gprs = [rxn.gene_reaction_rule for rxn in model.reactions]
+    gprs = gprs + [randomGPR(rng, genes[:6]) for i in range(200)]
+    expr = dict(zip(genes, rng.random(len(genes))))
+    for orIsSum in [True, False]:
+        for gpr in gprs:
+            tree = mapper.compileGPR(gpr, orIsSum = orIsSum)
+            assert mapper.evalGPRtree(tree, expr) == mapper.mapGPR(gpr, expr, orIsSum = orIsSum)[0], gpr
+
+def test_samplewise_equals_mapGPR():
+    mapper = corpse.omicsMapper()
+    df = expression(n_samples = 3)
+    res = mapper.mapExpressionToReaction(model, df, backend = "serial")
+    for sample in df.columns:
+        expr = mapper.parseData(model, df, column = sample)
+        ref = [mapper.mapGPR(rxn.gene_reaction_rule, expr)[0] for rxn in model.reactions]
+        assert np.array_equal(res[sample].values, np.array(ref, dtype = float))
+
+def test_vectorized_equals_samplewise():
+    mapper = corpse.omicsMapper()
+    df = expression(n_samples = 20)
+    for orIsSum in [True, False]:
+        ref = mapper.mapExpressionToReaction(model, df, orIsSum = orIsSum, engine = "samplewise", backend = "serial")
+        res = mapper.mapExpressionToReaction(model, df, orIsSum = orIsSum, engine = "vectorized", backend = "serial")
+        assert res.index.equals(ref.index) and res.columns.equals(ref.columns)
+        assert np.array_equal(res.values, ref.values)
+
+def test_sparse_equals_samplewise():
+    mapper = corpse.omicsMapper()
+    df = expression(n_samples = 20)
+    for orIsSum in [True, False]:
+        ref = mapper.mapExpressionToReaction(model, df, orIsSum = orIsSum, engine = "samplewise", backend = "serial")
+        res = mapper.mapExpressionToReaction(model, df, orIsSum = orIsSum, engine = "sparse", backend = "serial")
+        assert res.index.equals(ref.index) and res.columns.equals(ref.columns)
+        # the sparse products may sum in a different order
+        assert np.allclose(res.values, ref.values, rtol = 1E-12, atol = 0)
+
+def test_stream_csv_chunks(tmp_path):
+    mapper = corpse.omicsMapper()
+    df = expression()
+    df.to_csv(tmp_path / "expression.csv")
+    chunks = list(mapper.readColumnChunks(str(tmp_path / "expression.csv"), chunk_size = 3))
+    assert len(chunks) == 3
+    res = pd.concat(chunks, axis = 1)
+    assert list(res.index) == genes and list(res.columns) == list(df.columns)
+    assert np.allclose(res.values, df.values)
+
+def test_cache_maps_only_new_samples(tmp_path, capsys):
+    mapper = corpse.omicsMapper()
+    df = expression()
+    ref = mapper.mapExpressionToReaction(model, df, backend = "serial")
+    first = mapper.mapExpressionToReaction(model, df.iloc[:,:6], backend = "serial", cache = str(tmp_path))
+    assert "# Found 0 of 6 samples in the cache" in capsys.readouterr().out
+    # the cache is keyed by the values, not the names of the samples
+    res = mapper.mapExpressionToReaction(model, df.rename(columns = lambda x: "new_" + x), backend = "serial", cache = str(tmp_path))
+    assert "# Found 6 of 8 samples in the cache" in capsys.readouterr().out
+    assert list(res.columns) == ["new_" + x for x in df.columns]
+    assert np.array_equal(first.values, ref.values[:,:6])
+    assert np.array_equal(res.values, ref.values)
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = rasCache(str(tmp_path))
+    keys = ["aa1", "bb2", "cc3"]
+    for i, key in enumerate(keys):
+        cache.put(key, np.full(10, float(i)))
+        os.utime(cache.file(key), (1000 + i, 1000 + i))
+    # reading the oldest file makes it the most recently used one
+    assert np.array_equal(cache.get("aa1"), np.zeros(10))
+    cache.max_size = 2 * os.stat(cache.file("aa1")).st_size
+    cache.evict()
+    assert cache.get("bb2") is None
+    assert np.array_equal(cache.get("aa1"), np.zeros(10))
+    assert np.array_equal(cache.get("cc3"), np.full(10, 2.0))
@@ -0,0 +1,139 @@
+# regression checks for simpleFastcore on the textbook model
+
+import io
+import random
+import contextlib
+import importlib
+import pytest
+import cobra as cb
+
+# corpse.simpleFastcore is the class exported by corpse, get the module itself
+sf = importlib.import_module("corpse.simpleFastcore")
+
+model = cb.io.load_model("textbook")
+
+def consistent():
+    with contextlib.redirect_stdout(io.StringIO()):
+        fast = sf.simpleFastcore(model, [])
+    return(fast)
+
+def test_find_blocked_fast_equals_FVA():
+    fast = consistent()
+    with fast.active_model() as mod:
+        ref = cb.flux_analysis.find_blocked_reactions(mod, zero_cutoff = fast.zero_cutoff)
+    assert len(ref) > 0
+    assert sorted(fast.find_blocked_fast()) == sorted(ref)
+
+def test_native_equals_troppo():
+    fast = consistent()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fast.FVA_consistency(fast = True)
+    S, lb, ub = fast.get_arrays()
+    native = sf.nativeFastcore(S, lb, ub, fast.solver, fast.zero_cutoff)
+    troppo = sf.troppoFastcore(S, lb, ub, fast.solver, fast.zero_cutoff)
+    random.seed(1)
+    for i in range(10):
+        core = sorted(random.sample(range(S.shape[1]), 5))
+        assert [int(x) for x in native.fastcore(core)] == [int(x) for x in troppo.fastcore(core)], core
+
+def test_model_edits_and_assignment():
+    fast = consistent()
+    with contextlib.redirect_stdout(io.StringIO()):
+        # changed bounds and removed reactions of fast.model are taken over
+        fast.model.reactions.EX_glc__D_e.bounds = (-5, 0)
+        fast.model.remove_reactions([fast.model.reactions.PFK])
+        fast.FVA_consistency()
+        assert "PFK" not in fast.active_ids()
+        assert fast.get_model().reactions.EX_glc__D_e.bounds == (-5, 0)
+        fast.reset_model()
+        assert fast.model.reactions.EX_glc__D_e.bounds == model.reactions.EX_glc__D_e.bounds
+        # assigning a model starts from scratch
+        other = model.copy()
+        other.remove_reactions([other.reactions.PGK])
+        fast.model = other
+        assert len(fast.active_ids()) == len(other.reactions)
+
+def test_native_raises_solver_errors():
+    fast = consistent()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fast.FVA_consistency(fast = True)
+    S, lb, ub = fast.get_arrays()
+    native = sf.nativeFastcore(S, lb, ub, fast.solver, fast.zero_cutoff)
+    ref = [int(x) for x in native.fastcore([0, 1, 2])]
+    optimize = native.problem.optimize
+    def broken():
+        raise RuntimeError("solver failed")
+    native.problem.optimize = broken
+    with pytest.raises(RuntimeError):
+        native.fastcore([0, 1, 2])
+    # the auxiliary variables are removed again, the problem can be used for the next core set
+    native.problem.optimize = optimize
+    assert [int(x) for x in native.fastcore([0, 1, 2])] == ref
+
+def coreSets(n = 4, seed = 2):
+    ids = consistent().active_ids()
+    random.seed(seed)
+    return({"s" + str(i) : random.sample(ids, 5) for i in range(n)})
+
+def test_batch_equals_simpleFastcore():
+    core_sets = coreSets()
+    core_sets["bad"] = ["no_such_reaction"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        batch = sf.batchFastcore(model, core_sets, engine = "troppo")
+        batch.run()
+        for name, core_set in core_sets.items():
+            if name == "bad":
+                continue
+            ref = sf.simpleFastcore(model, core_set).run()
+            assert sorted(batch.get_reactions(name)) == sorted([x.id for x in ref.reactions]), name
+    # a failing core set does not stop the others
+    assert list(batch.failed.keys()) == ["bad"] and "bad" not in batch.results
+    assert len(batch.results) == len(core_sets) - 1
+
+def test_pool_equals_serial():
+    core_sets = coreSets(n = 6)
+    core_sets["bad"] = ["no_such_reaction"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        serial = sf.batchFastcore(model, core_sets)
+        serial.run()
+        pool = sf.batchFastcore(model, core_sets)
+        pool.run(num_cores = 2)
+    assert pool.results == serial.results
+    assert list(pool.failed.keys()) == ["bad"]
+
+def consistentIds(cache_path, method = "FVA_consistency"):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        fast = sf.simpleFastcore(model, [], consistency_cache = cache_path)
+        getattr(fast, method)()
+    return(sorted(fast.active_ids()), "consistency cache" in out.getvalue())
+
+def test_consistency_cache(tmp_path, monkeypatch):
+    for method in ["FVA_consistency", "fastcc"]:
+        monkeypatch.setattr(sf.simpleFastcore, "consistency_cache", {})
+        ref, hit = consistentIds(str(tmp_path), method)
+        assert not hit
+        # a second object takes the result from the memory
+        assert consistentIds(None, method) == (ref, True)
+        # other processes take it from the disk
+        monkeypatch.setattr(sf.simpleFastcore, "consistency_cache", {})
+        assert consistentIds(str(tmp_path), method) == (ref, True)
+    # other bounds give another key
+    fast = consistent()
+    key = fast.consistency_key("FVA")
+    fast.model.reactions.EX_glc__D_e.bounds = (-5, 0)
+    assert fast.consistency_key("FVA") != key
+
+def test_incremental_fastcc_repeat(monkeypatch):
+    monkeypatch.setattr(sf.simpleFastcore, "consistency_cache", {})
+    anaerobic = model.copy()
+    # without oxygen other reactions are blocked
+    anaerobic.reactions.EX_o2_e.lower_bound = 0
+    for mod in [model, anaerobic]:
+        ids = []
+        for incremental in [False, True]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                fast = sf.simpleFastcore(mod, [])
+                fast.fastcc_repeat(incremental = incremental)
+            ids.append(sorted(fast.active_ids()))
+        assert ids[0] == ids[1]